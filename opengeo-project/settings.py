@@ -90,6 +90,25 @@ WSGI_APPLICATION = 'opengeo-project.wsgi.application'
 
 DATABASES = LOADED_CONFIG["DATABASES"]
 
+# Caches shared by all workers and management commands, final results in the default one and registered persisted
+# queries in their own, so culling of results never evicts them. The database caches need
+# `python manage.py createcachetable` (it creates the tables of all of them), the config may replace any alias with
+# e.g. memcached. A database cache culls a third of its entries above MAX_ENTRIES, keep the one of persisted queries
+# above the number of distinct queries of all clients.
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+        "LOCATION": "opengeo_cache",
+    },
+    "persisted_queries": {
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+        "LOCATION": "opengeo_persisted_queries",
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    },
+    **LOADED_CONFIG.get("CACHES", {})
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
 
@@ -157,6 +176,7 @@ GRAPHENE = {
     'MIDDLEWARE': [
         'graphene_django_extras.ExtraGraphQLDirectiveMiddleware',
         'graphql_jwt.middleware.JSONWebTokenMiddleware',
+        'opengeo.schema.metrics.MetricsMiddleware',
     ]
 }
 
@@ -170,6 +190,89 @@ GRAPHENE_DJANGO_EXTRAS = {
     'CACHE_TIMEOUT': 300  # seconds
 }
 
+# Cache of parsed and validated graphql documents, shared by the HTTP view and the websocket consumer
+
+GRAPHQL_DOCUMENT_CACHE = {
+    'MAX_SIZE': 1000
+}
+
+# Automatic persisted queries
+# ALLOW_LIST (PERSISTED_QUERIES_ALLOW_LIST in the config) is a JSON file of the only allowed queries, a list or a
+# {hash: query} mapping, keep it smaller than the document cache. Registered queries are kept for TIMEOUT seconds
+# (None until culled) in the shared CACHES alias CACHE, a per-process cache would make clients re-register their
+# queries on every worker.
+
+PERSISTED_QUERIES = {
+    'ALLOW_LIST': LOADED_CONFIG.get("PERSISTED_QUERIES_ALLOW_LIST"),
+    'TIMEOUT': None,
+    'CACHE': 'persisted_queries'
+}
+
+# Maximum number of locations of one randomLocation query, larger counts are reduced to it
+
+RANDOM_LOCATIONS = {
+    'MAX_COUNT': 1000
+}
+
+# Static cost and depth limits of graphql operations, checked after validation and before execution
+# Lists are sized by the first of SIZE_ARGUMENTS (name: maximum) at or above them, otherwise by DEFAULT_LIST_SIZE.
+# Object types may override the weights of their fields in cost_weights.
+
+QUERY_COST = {
+    'MAX_DEPTH': 10,
+    'MAX_COST': 10000,
+    'OBJECT_COST': 1,
+    'SCALAR_COST': 0,
+    'DEFAULT_LIST_SIZE': 10,
+    'SIZE_ARGUMENTS': {
+        'limit': GRAPHENE_DJANGO_EXTRAS['MAX_PAGE_SIZE'],
+        'first': GRAPHENE_DJANGO_EXTRAS['MAX_PAGE_SIZE'],
+        'count': RANDOM_LOCATIONS['MAX_COUNT'],
+    }
+}
+
+# Batches of graphql operations sent to the HTTP view as one JSON array
+
+GRAPHQL_BATCH = {
+    'MAX_SIZE': 10
+}
+
+# Per-operation and per-field timings and SQL queries, served on /metrics to scrapers sending the bearer TOKEN
+# (METRICS_TOKEN in the config), without a token /metrics answers 404
+# Clients sending the DEBUG_HEADER get the breakdown of their operation in the response extensions, None disables it.
+# Label values above MAX_SERIES per metric are merged into one series.
+
+GRAPHQL_METRICS = {
+    'DURATION_BUCKETS': [.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10],
+    'COUNT_BUCKETS': [0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000],
+    'MAX_SERIES': 1000,
+    'DEBUG_HEADER': 'X-GraphQL-Metrics',
+    'TOKEN': LOADED_CONFIG.get("METRICS_TOKEN")
+}
+
+# Pool of pre-generated random locations, presets are keyed by the randomLocation arguments
+
+LOCATION_POOL = {
+    'PRESETS': [
+        {'min_density': 5, 'max_density': 10000},
+        {'min_density': 5, 'max_density': 10000, 'weighting': 'population'},
+        {'min_density': 50, 'max_density': 10000},
+        {'min_density': 500, 'max_density': 10000},
+        {'min_density': 2000, 'max_density': 10000},
+    ],
+    'LOW_WATERMARK': 50,
+    'HIGH_WATERMARK': 200,
+    'REFILL_INTERVAL': 5  # seconds
+}
+
+# Distance formula of the scoring engine: haversine, spherical_cosines or geodesic (exact, slow, for parity checks)
+
+SCORING_FORMULA = 'haversine'
+
+# Final results are cached per lobby game, changes of guesses invalidate them
+
+FINAL_RESULTS_CACHE_TIMEOUT = 3600  # seconds
+
 # Authentication user model
 
 AUTH_USER_MODEL = "opengeo.PlayerModel"
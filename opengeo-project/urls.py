@@ -18,7 +18,6 @@ from django.contrib.staticfiles.views import serve as serve_static
 from django.urls import re_path, path
 from django.views.decorators.cache import never_cache
 from django.views.decorators.csrf import csrf_exempt
-from graphene_django.views import GraphQLView
 from graphql_jwt.decorators import jwt_cookie
 from schema_graph.views import Schema
 
@@ -26,13 +25,14 @@ from opengeo.views import *
 
 urlpatterns = \
     [
-        re_path(r'^graphql/?$', csrf_exempt(jwt_cookie(GraphQLView.as_view(graphiql=True)))),
+        re_path(r'^graphql/?$', csrf_exempt(jwt_cookie(CachedGraphQLView.as_view(graphiql=True)))),
     ]
 
 urlpatterns += [
     re_path(r"^(?P<basepath>maps|maps-lite)/(?P<path>.*)/?$", csrf_exempt(MapsProxyView.as_view()), name="maps-proxy"),
     re_path(r'^identicon/(?P<data>[^/ ]+)/?$', IdenticonView.as_view()),
     re_path(r"^schema/?$", Schema.as_view()),
+    re_path(r"^metrics/?$", MetricsView.as_view()),
 ]
 
 if settings.ADMIN_ENABLED:
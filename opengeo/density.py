@@ -0,0 +1,726 @@
+import functools
+import json
+import logging
+import math
+import os
+import re
+import tempfile
+from pathlib import Path
+from typing import Tuple, Callable
+
+import numpy as np
+
+"""
+Precomputed structures over the population density raster
+"""
+
+logger = logging.getLogger(__name__)
+
+# Shared random generator, its choice() samples without replacement without permuting the whole population
+rng = np.random.default_rng()
+
+# No-data (sea) value of the dataset and of the compact raster
+DATASET_NODATA = 99999
+NODATA = np.iinfo(np.uint16).max
+
+
+def proj_to_raster(transformation_values: Tuple[float, ...], lon, lat) -> Tuple:
+    """
+    Converts geospatial coordinates to raster coordinates with the inverse of a GDAL geo transformation,
+    works for scalars as well as numpy arrays
+    :param transformation_values: GDAL geo transformation
+    :param lon: Longitude(s)
+    :param lat: Latitude(s)
+    :return: (x, y) raster coordinates
+    """
+    x0, a, b, y0, d, e = transformation_values
+    det = a * e - b * d
+    return (e * (lon - x0) - b * (lat - y0)) / det, (a * (lat - y0) - d * (lon - x0)) / det
+
+
+def raster_to_proj(transformation_values: Tuple[float, ...], x, y) -> Tuple:
+    """
+    Converts raster coordinates to geospatial coordinates with a GDAL geo transformation,
+    works for scalars as well as numpy arrays
+    :param transformation_values: GDAL geo transformation
+    :param x: raster column(s)
+    :param y: raster row(s)
+    :return: (longitude, latitude) coordinates
+    """
+    x0, a, b, y0, d, e = transformation_values
+    return x0 + x * a + y * b, y0 + x * d + y * e
+
+
+def compact_raster(data: np.ndarray, nodata: float = DATASET_NODATA) -> np.ndarray:
+    """
+    Quantizes densities to the nearest uint16 integer, no-data pixels become NODATA
+    :param data: density raster
+    :param nodata: no-data value of the raster, densities from this value up are no-data
+    :return: uint16 raster of the same shape
+    """
+    habitable = data < nodata
+    compact = np.full(data.shape, NODATA, dtype=np.uint16)
+    compact[habitable] = np.clip(np.rint(data[habitable]), 0, NODATA - 1)
+    return compact
+
+
+def row_areas(rows: int, transformation_values: Tuple[float, ...]) -> np.ndarray:
+    """
+    Relative areas of pixels in each row of a raster in geographic coordinates (cosine of the row latitude)
+    :param rows: number of rows
+    :param transformation_values: GDAL geo transformation of the raster
+    :return: array of areas, one per row
+    """
+    lat = transformation_values[3] + (np.arange(rows) + .5) * transformation_values[5]
+    return np.clip(np.cos(np.radians(lat)), 0, None)
+
+
+class RasterStore:
+    """
+    Converts the GeoTIFF dataset once into .npy files cached next to it.
+    Every worker memory-maps the cached files read-only, so the OS shares their pages between processes.
+    Cached files are named after the modification time and size of the dataset, which invalidates them on change.
+    """
+    # Bumped whenever the format of the cached arrays changes
+    version = 3
+
+    def __init__(self, path: Path):
+        """
+        :param path: path to the GeoTIFF dataset
+        """
+        self.path = path
+        stat = path.stat()
+        self.signature = f"{stat.st_mtime_ns:x}-{stat.st_size:x}-v{self.version}"
+
+    def _cache_path(self, name: str, suffix: str = ".npy") -> Path:
+        return self.path.with_name(f"{self.path.stem}.{name}.{self.signature}{suffix}")
+
+    @staticmethod
+    def _write_atomic(target: Path, write: Callable) -> None:
+        """
+        Writes a file through a temporary file, concurrently starting workers never see a partial file
+        :param target: final path of the file
+        :param write: function writing the content into an open binary file
+        :return: None
+        """
+        fd, tmp = tempfile.mkstemp(dir=target.parent, prefix=f".{target.name}.")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+            os.replace(tmp, target)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def _remove_stale(self) -> None:
+        """
+        Removes cached files of older versions of the dataset, only files named like _cache_path are touched
+        :return: None
+        """
+        cache_name = re.compile(rf"{re.escape(self.path.stem)}\.\w+\.[0-9a-f]+-[0-9a-f]+-v\d+\.(npy|json)")
+        for cached in self.path.parent.glob(f"{self.path.stem}.*"):
+            if cache_name.fullmatch(cached.name) and self.signature not in cached.name:
+                try:
+                    cached.unlink()
+                except OSError:
+                    pass
+
+    def _decode(self) -> Tuple[np.ndarray, Tuple[float, ...]]:
+        """
+        Decodes the GeoTIFF with GDAL
+        :return: (raster (bands, rows, columns), geo transformation)
+        """
+        # Imported only when the cache is cold, warm workers do not touch GDAL at all
+        import geoio
+
+        logger.info(f"Decoding {self.path.name}")
+        img = geoio.GeoImage(str(self.path.absolute()))
+        return np.ascontiguousarray(img.get_data()), tuple(img.get_gdal_obj().GetGeoTransform())
+
+    def load(self) -> Tuple[np.ndarray, Tuple[float, ...]]:
+        """
+        Loads the dataset, converting it to the cache first if needed
+        :return: (read-only memory-mapped raster (bands, rows, columns), GDAL geo transformation)
+        """
+        raster_cache = self._cache_path("raster")
+        transform_cache = self._cache_path("transform", ".json")
+        if not raster_cache.exists() or not transform_cache.exists():
+            data, transform = self._decode()
+            try:
+                self._write_atomic(transform_cache, lambda f: f.write(json.dumps(transform).encode()))
+                self._write_atomic(raster_cache, lambda f: np.save(f, data))
+            except OSError:
+                logger.warning(f"Could not cache {self.path.name}, every worker keeps its own copy")
+                return data, transform
+            self._remove_stale()
+        return np.load(raster_cache, mmap_mode="r"), tuple(json.loads(transform_cache.read_text()))
+
+    def array(self, name: str, build: Callable[[], np.ndarray]) -> np.ndarray:
+        """
+        Loads an array derived from the raster, the array is built and cached on the first use
+        :param name: unique name of the array
+        :param build: function building the array
+        :return: read-only memory-mapped array
+        """
+        cache = self._cache_path(name)
+        if not cache.exists():
+            array = build()
+            try:
+                self._write_atomic(cache, lambda f: np.save(f, array))
+            except OSError:
+                logger.warning(f"Could not cache {cache.name}, keeping it in memory")
+                return array
+        return np.load(cache, mmap_mode="r")
+
+
+class DensityIndex:
+    """
+    Pixels of the density raster sorted by their density.
+    Any density range resolves to a contiguous slice of the index via binary search.
+    """
+
+    def __init__(self, shape: Tuple[int, int], offsets: np.ndarray, densities: np.ndarray):
+        """
+        :param shape: shape of the indexed raster (rows, columns)
+        :param offsets: flat pixel offsets sorted by density
+        :param densities: sorted density keys, aligned with the offsets
+        """
+        self.shape = shape
+        self.offsets = offsets
+        self.densities = densities
+
+    @staticmethod
+    def _sorted_offsets(data: np.ndarray) -> np.ndarray:
+        flat = data.ravel()
+        offsets = np.argsort(flat, kind="stable")
+        # The stable sort keeps equal densities in raster (latitude) order, every run of them is shuffled,
+        # so a slice cut through a run is spread over the whole raster
+        keys = flat[offsets]
+        runs = np.flatnonzero(keys[1:] != keys[:-1]) + 1
+        for start, end in zip(np.r_[0, runs], np.r_[runs, flat.size]):
+            if end - start > 1:
+                rng.shuffle(offsets[start:end])
+        # int32 is enough for any reasonable raster
+        return offsets.astype(np.int32) if flat.size < 2 ** 31 else offsets
+
+    @classmethod
+    def build(cls, data: np.ndarray) -> "DensityIndex":
+        """
+        Builds the index in memory, should be done once at load time
+        :param data: 2D density raster (rows, columns)
+        :return: the index
+        """
+        offsets = cls._sorted_offsets(data)
+        return cls(data.shape, offsets, data.ravel()[offsets])
+
+    @classmethod
+    def cached(cls, store: RasterStore, data: np.ndarray) -> "DensityIndex":
+        """
+        Loads the index from the raster store, so it is shared between workers like the raster
+        :param store: the raster store
+        :param data: 2D density raster (rows, columns)
+        :return: the index
+        """
+        offsets = store.array("density_offsets", lambda: cls._sorted_offsets(data))
+        densities = store.array("density_keys", lambda: data.ravel()[offsets])
+        return cls(data.shape, offsets, densities)
+
+    def restrict(self, min_density: int, max_density: int, rows: Tuple[int, int],
+                 store: RasterStore = None) -> "DensityIndex":
+        """
+        Restricts the index to a density range within a band of rows, the order of the pixels is kept
+        :param min_density: minimum population density
+        :param max_density: maximum population density
+        :param rows: [first, last) rows of the band
+        :param store: the raster store caching the restricted index, None keeps it in memory
+        :return: the restricted index
+        """
+        def select(array: np.ndarray) -> Callable[[], np.ndarray]:
+            def build():
+                start, end = self.bounds(min_density, max_density)
+                offsets = self.offsets[start:end]
+                inside = (offsets >= rows[0] * self.shape[1]) & (offsets < rows[1] * self.shape[1])
+                return array[start:end][inside]
+            return build
+
+        if store is None:
+            return DensityIndex(self.shape, select(self.offsets)(), select(self.densities)())
+        name = f"density_{min_density}_{max_density}_rows_{rows[0]}_{rows[1]}"
+        return DensityIndex(self.shape, store.array(f"{name}_offsets", select(self.offsets)),
+                            store.array(f"{name}_keys", select(self.densities)))
+
+    def bounds(self, min_density: float, max_density: float) -> Tuple[int, int]:
+        """
+        Finds the slice of the index with densities in the closed interval
+        :param min_density: minimum population density
+        :param max_density: maximum population density
+        :return: (start, end) of the slice
+        """
+        dtype = self.densities.dtype
+        if np.issubdtype(dtype, np.integer):
+            # Integer keys, the searched values must have the same type or numpy casts the whole index
+            limits = np.iinfo(dtype)
+            if min_density > limits.max or max_density < limits.min:
+                return 0, 0
+            min_density = max(math.ceil(min_density), limits.min)
+            max_density = min(math.floor(max_density), limits.max)
+        start = int(np.searchsorted(self.densities, dtype.type(min_density), side="left"))
+        end = int(np.searchsorted(self.densities, dtype.type(max_density), side="right"))
+        return start, max(start, end)
+
+    def count(self, min_density: float, max_density: float) -> int:
+        """
+        Number of pixels with densities in the closed interval
+        :param min_density: minimum population density
+        :param max_density: maximum population density
+        :return: number of pixels
+        """
+        start, end = self.bounds(min_density, max_density)
+        return end - start
+
+    def cumulative_weights(self, weights: np.ndarray) -> np.ndarray:
+        """
+        Builds cumulative sums of pixel weights in the order of the index,
+        so the weights of any density range are a contiguous slice too
+        :param weights: weight of every pixel in the order of the index
+        :return: float64 cumulative sums aligned with the index
+        """
+        return np.cumsum(weights, dtype=np.float64)
+
+    def _pixels(self, chosen: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        y, x = np.divmod(self.offsets[chosen], self.shape[1])
+        return y, x, self.densities[chosen]
+
+    def sample(self, min_density: float, max_density: float, count: int) \
+            -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Randomly chooses pixels with densities in the closed interval in O(log n + count),
+        pixels are repeated only if there are not enough of them
+        :param min_density: minimum population density
+        :param max_density: maximum population density
+        :param count: number of pixels
+        :return: (y, x, density) arrays, empty if no pixel matches
+        """
+        return self._sample_slice(*self.bounds(min_density, max_density), count)
+
+    def _sample_slice(self, start: int, end: int, count: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        size = end - start
+        if size == 0:
+            empty = np.empty(0, dtype=np.intp)
+            return empty, empty, self.densities[:0]
+        chosen = start + rng.choice(size, count, replace=size <= count)
+        return self._pixels(chosen)
+
+    def percentile_slice(self, percentile: float, width: float, count: int, size: int) -> Tuple[int, int]:
+        """
+        Finds a slice of pixels around a percentile of the density distribution (the empirical CDF) in O(1)
+        :param percentile: percentile of the densities (0-100)
+        :param width: width of the slice in percent of the pixels
+        :param count: minimum number of pixels in the slice
+        :param size: number of pixels from the start of the index the distribution is made of, e.g. inhabited pixels
+        :return: (start, end) of the slice, never empty unless size is zero
+        """
+        window = min(size, max(int(width / 100 * size), count, 1))
+        start = int(percentile / 100 * size - window / 2)
+        start = min(max(start, 0), size - window)
+        return start, start + window
+
+    def sample_percentile(self, percentile: float, width: float, count: int, size: int) \
+            -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Randomly chooses pixels around a percentile of the density distribution in O(count)
+        :param percentile: percentile of the densities (0-100)
+        :param width: width of the slice in percent of the pixels
+        :param count: number of pixels
+        :param size: number of pixels from the start of the index the distribution is made of, e.g. inhabited pixels
+        :return: (y, x, density) arrays
+        """
+        return self._sample_slice(*self.percentile_slice(percentile, width, count, size), count)
+
+    def sample_weighted(self, min_density: float, max_density: float, count: int, cumulative: np.ndarray) \
+            -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Randomly chooses pixels with densities in the closed interval with probability proportional to their weights,
+        in O(log n + count log n) using binary search in the cumulative weights
+        :param min_density: minimum population density
+        :param max_density: maximum population density
+        :param count: number of pixels
+        :param cumulative: cumulative weights from cumulative_weights()
+        :return: (y, x, density) arrays, empty if no pixel matches
+        """
+        start, end = self.bounds(min_density, max_density)
+        low = cumulative[start - 1] if start > 0 else 0.
+        high = cumulative[end - 1] if end > 0 else 0.
+        if high <= low:
+            # Zero total weight, fall back to a uniform choice
+            return self.sample(min_density, max_density, count)
+        chosen = np.searchsorted(cumulative, rng.uniform(low, high, count), side="right")
+        return self._pixels(np.clip(chosen, start, end - 1))
+
+
+class HabitationMask:
+    """
+    Bit-packed mask of habitable pixels (not no-data), a sixteenth of the size of the compact raster.
+    Used as the cheap first test before the densities themselves are read.
+    """
+
+    def __init__(self, bits: np.ndarray):
+        """
+        :param bits: mask packed along rows by np.packbits
+        """
+        self.bits = bits
+
+    @classmethod
+    def cached(cls, store: RasterStore, data: np.ndarray) -> "HabitationMask":
+        """
+        Loads the mask from the raster store, it is built on the first use
+        :param store: the raster store
+        :param data: 2D compact density raster (rows, columns)
+        :return: the mask
+        """
+        return cls(store.array("habitation_mask", lambda: np.packbits(data != NODATA, axis=1)))
+
+    def __call__(self, rows: np.ndarray, columns: np.ndarray) -> np.ndarray:
+        """
+        :param rows: pixel rows
+        :param columns: pixel columns
+        :return: boolean array, whether the pixels are habitable
+        """
+        return (self.bits[rows, columns >> 3] >> (7 - (columns & 7))) & 1 == 1
+
+
+class DensityPyramid:
+    """
+    Per-block minimum and maximum densities of the raster for several block sizes, from coarse to fine.
+    Blocks that cannot contain a density range are discarded level by level without touching full-resolution pixels.
+    """
+    # Block sizes in pixels, each level splits the blocks of the previous one by the factor
+    factor = 4
+    block_sizes = (256, 64, 16, 4)
+
+    def __init__(self, shape: Tuple[int, int], lows: Tuple[np.ndarray, ...], highs: Tuple[np.ndarray, ...],
+                 nodata: float):
+        """
+        :param shape: shape of the raster (rows, columns)
+        :param lows: minimum density of every block, one array per level
+        :param highs: maximum density of every block, one array per level
+        :param nodata: densities from this value up are no-data (sea) and are ignored
+        """
+        self.shape = shape
+        self.lows = lows
+        self.highs = highs
+        self.nodata = nodata
+        self._eligible = functools.lru_cache(maxsize=64)(self._eligible_blocks)
+
+    @classmethod
+    def _reduce(cls, data: np.ndarray, size: int, fill: float, reduce: Callable) -> np.ndarray:
+        rows, columns = -(-data.shape[0] // size), -(-data.shape[1] // size)
+        padded = np.full((rows * size, columns * size), fill, dtype=data.dtype)
+        padded[:data.shape[0], :data.shape[1]] = data
+        return reduce(padded.reshape(rows, size, columns, size), axis=(1, 3))
+
+    @classmethod
+    def _level(cls, data: np.ndarray, size: int, nodata: float, lowest: bool) -> np.ndarray:
+        valid = data < nodata
+        if lowest:
+            return cls._reduce(np.where(valid, data, np.inf).astype(np.float32), size, np.inf, np.min)
+        return cls._reduce(np.where(valid, data, -np.inf).astype(np.float32), size, -np.inf, np.max)
+
+    @classmethod
+    def cached(cls, store: RasterStore, data: np.ndarray, nodata: float = NODATA) -> "DensityPyramid":
+        """
+        Loads the pyramid from the raster store, it is built on the first use
+        :param store: the raster store
+        :param data: 2D density raster (rows, columns)
+        :param nodata: densities from this value up are no-data (sea) and are ignored
+        :return: the pyramid
+        """
+        lows = tuple(store.array(f"pyramid_low_{size}", lambda size=size: cls._level(data, size, nodata, True))
+                     for size in cls.block_sizes)
+        highs = tuple(store.array(f"pyramid_high_{size}", lambda size=size: cls._level(data, size, nodata, False))
+                      for size in cls.block_sizes)
+        return cls(data.shape, lows, highs, nodata)
+
+    def _matching(self, level: int, rows: np.ndarray, columns: np.ndarray, min_density: float,
+                  max_density: float) -> np.ndarray:
+        return (self.lows[level][rows, columns] <= max_density) & (self.highs[level][rows, columns] >= min_density)
+
+    def _eligible_blocks(self, min_density: float, max_density: float) -> Tuple[np.ndarray, np.ndarray]:
+        rows, columns = np.nonzero((self.lows[0] <= max_density) & (self.highs[0] >= min_density))
+        split = np.arange(self.factor)
+        for level in range(1, len(self.block_sizes)):
+            # Children of the eligible blocks on the finer level
+            rows = (rows[:, None, None] * self.factor + split[None, :, None]).repeat(self.factor, axis=2).ravel()
+            columns = (columns[:, None, None] * self.factor + split[None, None, :]).repeat(self.factor, axis=1).ravel()
+            inside = (rows < self.lows[level].shape[0]) & (columns < self.lows[level].shape[1])
+            rows, columns = rows[inside], columns[inside]
+            matching = self._matching(level, rows, columns, min_density, max_density)
+            rows, columns = rows[matching], columns[matching]
+        return rows, columns
+
+    def eligible_blocks(self, min_density: float, max_density: float) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Finds the finest blocks that may contain a density in the closed interval, results of recent ranges are cached
+        :param min_density: minimum population density
+        :param max_density: maximum population density
+        :return: (row, column) arrays of block indices on the finest level, None if no-data densities are requested
+        """
+        if max_density >= self.nodata:
+            return None
+        return self._eligible(min_density, max_density)
+
+    @property
+    def block_size(self) -> int:
+        """
+        :return: size of the finest blocks in pixels
+        """
+        return self.block_sizes[-1]
+
+
+class RejectionSampler:
+    """
+    Draws uniformly distributed coordinates and keeps those with a matching population density.
+    Candidates are drawn and converted to raster indices in numpy batches, the batch size adapts to the acceptance
+    rate. With a density pyramid, candidates are drawn only from blocks that may contain the density range.
+    """
+    # Bounds of the batch size and of the number of batches per request
+    min_batch = 1024
+    max_batch = 1 << 20
+    max_rounds = 16
+
+    def __init__(self, data: np.ndarray, transformation_values: Tuple[float, ...], pyramid: DensityPyramid = None,
+                 mask: HabitationMask = None, lat_range: Tuple[float, float] = (-60, 80),
+                 lon_range: Tuple[float, float] = (-180, 180)):
+        """
+        :param data: 2D density raster (rows, columns)
+        :param transformation_values: GDAL geo transformation of the raster
+        :param pyramid: density pyramid of the raster
+        :param mask: habitation mask of the raster
+        :param lat_range: range of drawn latitudes, ignores antarctic and far north by default
+        :param lon_range: range of drawn longitudes
+        """
+        self.data = data
+        self.transformation_values = transformation_values
+        self.pyramid = pyramid
+        self.mask = mask
+        self.lat_range = lat_range
+        self.lon_range = lon_range
+
+    def _draw(self, size: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        lat = rng.uniform(*self.lat_range, size)
+        lon = rng.uniform(*self.lon_range, size)
+        x, y = proj_to_raster(self.transformation_values, lon, lat)
+        # Wraps around the same way as a single point lookup does
+        return lat, lon, y.astype(np.intp) % self.data.shape[0], x.astype(np.intp) % self.data.shape[1]
+
+    def _draw_blocks(self, size: int, blocks: Tuple[np.ndarray, np.ndarray]) \
+            -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        chosen = rng.integers(blocks[0].shape[0], size=size)
+        block_size = self.pyramid.block_size
+        y = (blocks[0][chosen] + rng.random(size)) * block_size
+        x = (blocks[1][chosen] + rng.random(size)) * block_size
+        lon, lat = raster_to_proj(self.transformation_values, x, y)
+        rows, columns = y.astype(np.intp), x.astype(np.intp)
+        # Blocks on the edges may reach out of the raster or of the coordinate ranges
+        inside = (rows < self.data.shape[0]) & (columns < self.data.shape[1]) & \
+                 (lat >= self.lat_range[0]) & (lat < self.lat_range[1]) & \
+                 (lon >= self.lon_range[0]) & (lon < self.lon_range[1])
+        return lat[inside], lon[inside], rows[inside], columns[inside]
+
+    def sample(self, min_density: float, max_density: float, count: int) \
+            -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Samples coordinates with densities in the closed interval using a bounded number of numpy batches
+        :param min_density: minimum population density
+        :param max_density: maximum population density
+        :param count: number of coordinates
+        :return: (latitude, longitude, density) arrays, shorter than count if the batches did not yield enough matches
+        """
+        blocks = self.pyramid.eligible_blocks(min_density, max_density) if self.pyramid is not None else None
+        if blocks is not None and blocks[0].shape[0] == 0:
+            return np.empty(0), np.empty(0), self.data[:0, 0]
+        habitable_only = self.mask is not None and max_density < NODATA
+        accepted = []
+        found = 0
+        drawn = 0
+        batch = max(self.min_batch, count)
+        for _ in range(self.max_rounds):
+            if found >= count:
+                break
+            lat, lon, rows, columns = self._draw(batch) if blocks is None else self._draw_blocks(batch, blocks)
+            if habitable_only:
+                habitable = self.mask(rows, columns)
+                lat, lon, rows, columns = lat[habitable], lon[habitable], rows[habitable], columns[habitable]
+            density = self.data[rows, columns]
+            matching = (density >= min_density) & (density <= max_density)
+            accepted.append((lat[matching], lon[matching], density[matching]))
+            found += accepted[-1][0].shape[0]
+            drawn += batch
+            # Estimate the acceptance rate pessimistically and size the next batch to cover the rest
+            rate = max(found, 1) / drawn
+            batch = int(min(self.max_batch, max(self.min_batch, 1.5 * (count - found) / rate)))
+        lat, lon, density = (np.concatenate(a)[:count] for a in zip(*accepted))
+        return lat, lon, density
+
+
+def raster_rect(transformation_values: Tuple[float, ...], shape: Tuple[int, int],
+                min_lat: float, min_lon: float, max_lat: float, max_lon: float) -> Tuple[int, int, int, int]:
+    """
+    Converts a geographic bounding box to a rectangle of raster pixels, clipped to the raster
+    :param transformation_values: GDAL geo transformation of the raster
+    :param shape: shape of the raster (rows, columns)
+    :param min_lat: southern edge
+    :param min_lon: western edge
+    :param max_lat: northern edge
+    :param max_lon: eastern edge
+    :return: (first row, first column, end row, end column), the ends are exclusive
+    """
+    x_a, y_a = proj_to_raster(transformation_values, min_lon, max_lat)
+    x_b, y_b = proj_to_raster(transformation_values, max_lon, min_lat)
+    y0, y1 = sorted((y_a, y_b))
+    x0, x1 = sorted((x_a, x_b))
+    return (int(np.clip(np.floor(y0), 0, shape[0])), int(np.clip(np.floor(x0), 0, shape[1])),
+            int(np.clip(np.ceil(y1), 0, shape[0])), int(np.clip(np.ceil(x1), 0, shape[1])))
+
+
+class RegionIndex:
+    """
+    Summed-area tables of pixel counts per density band.
+    Pixels of a band inside any rectangle are counted in O(1) and sampled directly by binary search over the tables.
+    """
+    # Edges of the density bands, densities from the last edge up are no-data (sea) and are not indexed
+    edges = (0, 10, 50, 250, 1000, 5000, NODATA)
+    # Sampling rounds for density ranges partially covering a band before the rectangle is scanned
+    max_rounds = 4
+
+    def __init__(self, data: np.ndarray, tables: Tuple[np.ndarray, ...]):
+        """
+        :param data: 2D density raster (rows, columns)
+        :param tables: summed-area table of every band, shape (rows + 1, columns + 1)
+        """
+        self.data = data
+        self.tables = tables
+
+    @staticmethod
+    def _table(data: np.ndarray, low: float, high: float) -> np.ndarray:
+        table = np.zeros((data.shape[0] + 1, data.shape[1] + 1), dtype=np.uint32)
+        np.cumsum((data >= low) & (data < high), axis=0, dtype=np.uint32, out=table[1:, 1:])
+        np.cumsum(table[1:, 1:], axis=1, dtype=np.uint32, out=table[1:, 1:])
+        return table
+
+    @classmethod
+    def cached(cls, store: RasterStore, data: np.ndarray) -> "RegionIndex":
+        """
+        Loads the tables from the raster store, they are built on the first use
+        :param store: the raster store
+        :param data: 2D density raster (rows, columns)
+        :return: the index
+        """
+        return cls(data, tuple(store.array(f"region_{low}_{high}",
+                                           lambda low=low, high=high: cls._table(data, low, high))
+                               for low, high in zip(cls.edges, cls.edges[1:])))
+
+    @staticmethod
+    def _rect_count(table: np.ndarray, rect: Tuple[int, int, int, int]) -> int:
+        y0, x0, y1, x1 = rect
+        return int(table[y1, x1]) - int(table[y0, x1]) - int(table[y1, x0]) + int(table[y0, x0])
+
+    def _bands(self, min_density: float, max_density: float) -> Tuple[list, list]:
+        """
+        :return: (bands overlapping the closed interval, bands fully inside it)
+        """
+        overlapping, inside = [], []
+        for band, (low, high) in enumerate(zip(self.edges, self.edges[1:])):
+            if low <= max_density and high > min_density:
+                overlapping.append(band)
+                if min_density <= low and high <= max_density:
+                    inside.append(band)
+        return overlapping, inside
+
+    def count_bounds(self, min_density: float, max_density: float, rect: Tuple[int, int, int, int]) \
+            -> Tuple[int, int]:
+        """
+        Bounds the number of pixels with densities in the closed interval inside a rectangle in O(1),
+        the bounds are equal when the interval is aligned with the band edges
+        :param min_density: minimum population density
+        :param max_density: maximum population density
+        :param rect: rectangle from raster_rect()
+        :return: (lower bound, upper bound)
+        """
+        overlapping, inside = self._bands(min_density, max_density)
+        return (sum(self._rect_count(self.tables[band], rect) for band in inside),
+                sum(self._rect_count(self.tables[band], rect) for band in overlapping))
+
+    def _select(self, table: np.ndarray, rect: Tuple[int, int, int, int], ranks: np.ndarray) \
+            -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Finds pixels of a band by their rank in row-major order inside the rectangle
+        :param table: summed-area table of the band
+        :param rect: rectangle from raster_rect()
+        :param ranks: ranks lower than the number of pixels of the band in the rectangle
+        :return: (y, x) arrays
+        """
+        y0, x0, y1, x1 = rect
+        # Pixels in the rows of the rectangle above each row, non-decreasing
+        above = table[y0:y1 + 1, x1].astype(np.int64) - table[y0:y1 + 1, x0] - int(table[y0, x1]) + int(table[y0, x0])
+        rows = np.searchsorted(above, ranks, side="right") - 1
+        rest = ranks - above[rows]
+        y = y0 + rows
+        before = table[y + 1, x0].astype(np.int64) - table[y, x0]
+        # Binary search for the first column whose prefix of the row holds more than `rest` pixels
+        low = np.full(ranks.shape, x0 + 1)
+        high = np.full(ranks.shape, x1)
+        while np.any(low < high):
+            middle = (low + high) // 2
+            enough = table[y + 1, middle].astype(np.int64) - table[y, middle] - before > rest
+            high = np.where(enough, middle, high)
+            low = np.where(enough, low, middle + 1)
+        return y, low - 1
+
+    def sample(self, min_density: float, max_density: float, count: int, rect: Tuple[int, int, int, int]) \
+            -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Randomly chooses pixels with densities in the closed interval inside a rectangle,
+        pixels are repeated only if there are not enough of them
+        :param min_density: minimum population density
+        :param max_density: maximum population density
+        :param count: number of pixels
+        :param rect: rectangle from raster_rect()
+        :return: (y, x, density) arrays, empty as soon as it is known that no pixel matches
+        """
+        empty = np.empty(0, dtype=np.intp)
+        overlapping, inside = self._bands(min_density, max_density)
+        counts = np.array([self._rect_count(self.tables[band], rect) for band in overlapping], dtype=np.int64)
+        total = int(counts.sum())
+        if total == 0:
+            return empty, empty, self.data[:0, 0]
+        starts = np.concatenate(([0], np.cumsum(counts)))
+        found_y, found_x = [], []
+        found = 0
+        for _ in range(1 if inside == overlapping else self.max_rounds):
+            ranks = rng.choice(total, count, replace=total <= count)
+            which = np.searchsorted(starts, ranks, side="right") - 1
+            for i, band in enumerate(overlapping):
+                selected = which == i
+                if np.any(selected):
+                    y, x = self._select(self.tables[band], rect, ranks[selected] - starts[i])
+                    density = self.data[y, x]
+                    matching = (density >= min_density) & (density <= max_density)
+                    found_y.append(y[matching])
+                    found_x.append(x[matching])
+                    found += int(matching.sum())
+            if found >= count:
+                break
+        if found < count:
+            # Density range covers only small parts of the bands, scan the rectangle itself
+            y0, x0, y1, x1 = rect
+            window = self.data[y0:y1, x0:x1]
+            y, x = np.nonzero((window >= min_density) & (window <= max_density))
+            if y.shape[0] == 0:
+                return empty, empty, self.data[:0, 0]
+            chosen = rng.choice(y.shape[0], count, replace=y.shape[0] <= count)
+            y, x = y0 + y[chosen], x0 + x[chosen]
+        else:
+            y, x = np.concatenate(found_y)[:count], np.concatenate(found_x)[:count]
+        return y, x, self.data[y, x]
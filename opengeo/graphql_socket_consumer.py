@@ -1,9 +1,13 @@
 import channels
 import channels.auth
 import channels_graphql_ws
+from asgiref.sync import sync_to_async
+from graphql import GraphQLError
 from graphql_jwt import Verify
 from graphql_jwt.middleware import JSONWebTokenMiddleware
 
+from opengeo.schema.metrics import MetricsMiddleware
+from opengeo.schema.persisted_queries import persisted_queries
 from opengeo.schema.schema import schema
 
 
@@ -40,6 +44,19 @@ class MyGraphqlWsConsumer(channels_graphql_ws.GraphqlWsConsumer):
         # https://github.com/datadvance/DjangoChannelsGraphqlWs/issues/23
         self.scope["user"] = await channels.auth.get_user(self.scope)
 
+    async def receive_json(self, content):
+        """Resolve persisted queries of started operations."""
+        if content.get("type", "").upper() == "START":
+            payload = content.get("payload", {})
+            try:
+                payload["query"] = await sync_to_async(persisted_queries.resolve)(payload.get("query"),
+                                                                                  payload.get("extensions"))
+            except GraphQLError as e:
+                await self._send_gql_data(content["id"], None, [e])
+                await self._send_gql_complete(content["id"])
+                return
+        await super().receive_json(content)
+
     schema = schema
     jwt_middleware = JSONWebTokenMiddleware()
-    middleware = [jwt_middleware.resolve]
+    middleware = [jwt_middleware.resolve, MetricsMiddleware().resolve]
@@ -0,0 +1,179 @@
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+
+from django.db import transaction
+from django.db.models import Count, Q, QuerySet, Sum
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from opengeo.models import GameScoreModel, GuessModel, PlayerScoreModel
+
+"""
+Leaderboards materialized from finished guesses
+
+Every finished guess updates the tables of its player in place, deleted ones rebuild the entries of their players once
+the deletion is committed, reads
+take the top entries of a sorted index and page through it with a (score, player) cursor.
+"""
+
+
+def record_guess(guess: GuessModel) -> None:
+    """
+    Adds a finished and scored guess to the leaderboards of its player
+    :param guess: the guess, its location has to be loaded
+    :return: None
+    """
+    if guess.score is None:
+        return
+    with transaction.atomic():
+        # Total of the player in this lobby game, including the guess
+        game_total = GuessModel.objects \
+            .filter(lobby_game_id=guess.lobby_game_id, player_id=guess.player_id, score__isnull=False) \
+            .aggregate(total=Sum("score"), guesses=Count("id"))
+        first_guess = game_total["guesses"] == 1
+        player_score, _ = PlayerScoreModel.objects.select_for_update().get_or_create(player_id=guess.player_id)
+        player_score.total_score += guess.score
+        player_score.best_game_score = max(player_score.best_game_score, game_total["total"])
+        player_score.guesses += 1
+        player_score.games += first_guess
+        player_score.save()
+        game_score, _ = GameScoreModel.objects.select_for_update() \
+            .get_or_create(game_id=guess.location.game_id, player_id=guess.player_id)
+        game_score.best_score = max(game_score.best_score, game_total["total"])
+        game_score.total_score += guess.score
+        game_score.plays += first_guess
+        game_score.save()
+
+
+def rebuild_player(player_id: int) -> None:
+    """
+    Recomputes the global and the game entries of one player from the scored guesses, entries without guesses are
+    removed
+    :param player_id: id of the player
+    :return: None
+    """
+    with transaction.atomic():
+        # Locks the entry like record_guess, so concurrent guesses are not lost
+        list(PlayerScoreModel.objects.select_for_update().filter(player_id=player_id))
+        totals = list(GuessModel.objects
+                      .filter(player_id=player_id, score__isnull=False)
+                      .values("lobby_game_id", "location__game_id")
+                      .annotate(total=Sum("score"), guesses=Count("id"))
+                      .order_by())
+        games: Dict[int, GameScoreModel] = {}
+        for row in totals:
+            game = games.setdefault(row["location__game_id"],
+                                    GameScoreModel(game_id=row["location__game_id"], player_id=player_id))
+            game.best_score = max(game.best_score, row["total"])
+            game.total_score += row["total"]
+            game.plays += 1
+        GameScoreModel.objects.filter(player_id=player_id).delete()
+        GameScoreModel.objects.bulk_create(games.values())
+        if not totals:
+            PlayerScoreModel.objects.filter(player_id=player_id).delete()
+            return
+        PlayerScoreModel.objects.update_or_create(player_id=player_id, defaults={
+            "total_score": sum(row["total"] for row in totals),
+            "best_game_score": max(row["total"] for row in totals),
+            "games": len(totals),
+            "guesses": sum(row["guesses"] for row in totals),
+        })
+
+
+# Players whose entries are rebuilt at the next commit, per thread like the database connections
+_pending = threading.local()
+
+
+def _rebuild_pending() -> None:
+    """
+    Rebuilds the entries of every pending player once, later callbacks of the same commit find nothing to do
+    :return: None
+    """
+    players: Set[int] = getattr(_pending, "players", set())
+    _pending.players = set()
+    for player_id in players:
+        rebuild_player(player_id)
+
+
+@receiver(post_delete, sender=GuessModel, dispatch_uid="leaderboard_guess_delete")
+def remove_guess(sender, instance: GuessModel, **kwargs):
+    """
+    After a scored guess is deleted and committed, rebuild the entries of its player, a cascade deleting many guesses
+    rebuilds every player once
+    :param sender:
+    :param instance:
+    :param kwargs:
+    :return:
+    """
+    if instance.score is None:
+        return
+    if not hasattr(_pending, "players"):
+        _pending.players = set()
+    _pending.players.add(instance.player_id)
+    transaction.on_commit(_rebuild_pending, using=kwargs.get("using"))
+
+
+def rebuild(chunk_size: int = 1000) -> Tuple[int, int]:
+    """
+    Recomputes all leaderboards from the scored guesses
+    :param chunk_size: number of rows inserted at once
+    :return: (number of player entries, number of game entries)
+    """
+    players: Dict[int, PlayerScoreModel] = {}
+    games: Dict[Tuple[int, int], GameScoreModel] = {}
+    # One row per player and lobby game
+    totals = GuessModel.objects \
+        .filter(score__isnull=False) \
+        .values("player_id", "lobby_game_id", "location__game_id") \
+        .annotate(total=Sum("score"), guesses=Count("id")) \
+        .order_by()
+    for row in totals.iterator():
+        player = players.setdefault(row["player_id"], PlayerScoreModel(player_id=row["player_id"]))
+        player.total_score += row["total"]
+        player.best_game_score = max(player.best_game_score, row["total"])
+        player.guesses += row["guesses"]
+        player.games += 1
+        key = (row["location__game_id"], row["player_id"])
+        game = games.setdefault(key, GameScoreModel(game_id=key[0], player_id=key[1]))
+        game.best_score = max(game.best_score, row["total"])
+        game.total_score += row["total"]
+        game.plays += 1
+    with transaction.atomic():
+        PlayerScoreModel.objects.all().delete()
+        GameScoreModel.objects.all().delete()
+        PlayerScoreModel.objects.bulk_create(players.values(), batch_size=chunk_size)
+        GameScoreModel.objects.bulk_create(games.values(), batch_size=chunk_size)
+    return len(players), len(games)
+
+
+def encode_cursor(score: float, player_id: int) -> str:
+    return f"{score!r}:{player_id}"
+
+
+def decode_cursor(cursor: str) -> Tuple[float, int]:
+    """
+    :param cursor: cursor from encode_cursor
+    :return: (score, player id)
+    :raises ValueError: on a malformed cursor
+    """
+    score, player_id = cursor.split(":")
+    return float(score), int(player_id)
+
+
+def top(queryset: QuerySet, order: str, first: int, after: Optional[str] = None) -> Tuple[List, Optional[str]]:
+    """
+    Reads one page of a leaderboard sorted by a score column, highest first
+    :param queryset: entries of the leaderboard
+    :param order: score column
+    :param first: page size
+    :param after: cursor of the last entry of the previous page
+    :return: (entries, cursor of the next page or None on the last page)
+    """
+    if after:
+        score, player_id = decode_cursor(after)
+        queryset = queryset.filter(Q(**{f"{order}__lt": score}) | Q(**{order: score, "player_id__gt": player_id}))
+    entries = list(queryset.select_related("player").order_by(f"-{order}", "player_id")[:first + 1])
+    if len(entries) <= first:
+        return entries, None
+    entries = entries[:first]
+    return entries, encode_cursor(getattr(entries[-1], order), entries[-1].player_id)
@@ -0,0 +1,126 @@
+import logging
+import threading
+from collections import deque, Counter
+from typing import Callable, Dict, List, Optional, Tuple
+
+"""
+Pool of pre-generated random locations
+"""
+
+logger = logging.getLogger(__name__)
+
+PresetKey = Tuple[int, int, str, Optional[int]]
+
+
+class LocationPool:
+    """
+    Keeps pre-generated random locations of popular presets in memory, a background thread tops them up.
+    A preset is refilled up to its high watermark once it falls below its low watermark.
+    """
+
+    def __init__(self, generate: Callable[..., list], presets: List[Dict], low_watermark: int = 50,
+                 high_watermark: int = 200, refill_interval: float = 5):
+        """
+        :param generate: function generating locations, called with count, min_density, max_density, weighting and
+        difficulty
+        :param presets: dicts with min_density, max_density, weighting and difficulty (all optional)
+        and optionally low_watermark, high_watermark
+        :param low_watermark: default number of locations that triggers a refill
+        :param high_watermark: default number of locations after a refill
+        :param refill_interval: seconds between periodic checks of the watermarks
+        """
+        self._generate = generate
+        self._pools: Dict[PresetKey, deque] = {}
+        self._watermarks: Dict[PresetKey, Tuple[int, int]] = {}
+        for preset in presets:
+            key = self.key(preset.get("min_density", 5), preset.get("max_density", 10000),
+                           preset.get("weighting", "uniform"), preset.get("difficulty"))
+            self._pools[key] = deque()
+            self._watermarks[key] = (preset.get("low_watermark", low_watermark),
+                                     preset.get("high_watermark", high_watermark))
+        self._refill_interval = refill_interval
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.hits = Counter()
+        self.misses = Counter()
+
+    @staticmethod
+    def key(min_density: int, max_density: int, weighting: str, difficulty: Optional[int]) -> PresetKey:
+        return min_density, max_density, weighting, difficulty
+
+    def _start(self) -> None:
+        """
+        Starts the refill thread on the first use, so management commands never start it
+        :return: None
+        """
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._refill_forever, name="location-pool", daemon=True)
+                self._thread.start()
+
+    def take(self, count: int, min_density: int, max_density: int, weighting: str,
+             difficulty: Optional[int] = None) -> Optional[list]:
+        """
+        Takes locations of a preset from the pool
+        :param count: number of locations
+        :param min_density: minimum population density
+        :param max_density: maximum population density
+        :param weighting: weighting of the locations
+        :param difficulty: difficulty of the locations
+        :return: list of locations or None if the preset is not pooled or the pool does not have enough locations
+        """
+        key = self.key(min_density, max_density, weighting, difficulty)
+        pool = self._pools.get(key)
+        if pool is None:
+            return None
+        if self._thread is None:
+            self._start()
+        with self._lock:
+            if len(pool) >= count:
+                locations = [pool.popleft() for _ in range(count)]
+                self.hits[key] += 1
+            else:
+                locations = None
+                self.misses[key] += 1
+            if len(pool) < self._watermarks[key][0]:
+                self._wake.set()
+        return locations
+
+    def stats(self) -> List[Dict]:
+        """
+        :return: size, hits and misses of every preset
+        """
+        with self._lock:
+            return [{"min_density": key[0], "max_density": key[1], "weighting": key[2], "difficulty": key[3],
+                     "size": len(pool), "hits": self.hits[key], "misses": self.misses[key]}
+                    for key, pool in self._pools.items()]
+
+    def _refill(self, initial: bool = False) -> None:
+        """
+        Tops up presets below their low watermark (all of them initially) to their high watermark
+        :param initial: whether this is the first fill
+        :return: None
+        """
+        for key, pool in self._pools.items():
+            low, high = self._watermarks[key]
+            with self._lock:
+                missing = high - len(pool) if initial or len(pool) < low else 0
+            if missing > 0:
+                min_density, max_density, weighting, difficulty = key
+                locations = self._generate(count=missing, min_density=min_density, max_density=max_density,
+                                           weighting=weighting, difficulty=difficulty)
+                with self._lock:
+                    pool.extend(locations)
+                logger.debug(f"Refilled location pool {key} with {len(locations)} locations")
+
+    def _refill_forever(self) -> None:
+        initial = True
+        while True:
+            try:
+                self._refill(initial)
+                initial = False
+            except Exception:
+                logger.exception("Location pool refill failed")
+            self._wake.wait(self._refill_interval)
+            self._wake.clear()
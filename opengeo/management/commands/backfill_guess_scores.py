@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from opengeo.models import GuessModel
+from opengeo.results_cache import invalidate_final_results
+
+"""
+Backfill of stored distances and scores of finished guesses
+"""
+
+
+class Command(BaseCommand):
+    help = "Computes the stored distance and score of finished guesses in bulk chunks"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=1000, help="Number of guesses updated at once")
+        parser.add_argument("--all", action="store_true", help="Recompute guesses that already have a score")
+
+    def handle(self, *args, chunk_size, all, **options):
+        queryset = GuessModel.objects.filter(guess_end__isnull=False)
+        if not all:
+            queryset = queryset.filter(score__isnull=True)
+        # Keyset iteration, updated guesses may drop out of the filtered queryset
+        last_id, updated = 0, 0
+        while True:
+            guesses = list(queryset.filter(id__gt=last_id).select_related("location").order_by("id")[:chunk_size])
+            if not guesses:
+                break
+            GuessModel.compute_scores(guesses)
+            GuessModel.objects.bulk_update(guesses, ["distance_m", "score"])
+            # bulk_update does not send post_save
+            for lobby_game_id in {guess.lobby_game_id for guess in guesses}:
+                invalidate_final_results(lobby_game_id)
+            last_id = guesses[-1].id
+            updated += len(guesses)
+            self.stdout.write(f"Updated {updated} guesses")
+        self.stdout.write(self.style.SUCCESS(f"Backfilled {updated} guesses"))
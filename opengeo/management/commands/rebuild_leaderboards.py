@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from opengeo import leaderboard
+
+"""
+Rebuild of the materialized leaderboards
+"""
+
+
+class Command(BaseCommand):
+    help = "Recomputes the leaderboards from the scored guesses, run it after backfill_guess_scores"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=1000, help="Number of entries inserted at once")
+
+    def handle(self, *args, chunk_size, **options):
+        players, games = leaderboard.rebuild(chunk_size)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {players} player and {games} game leaderboard entries"))
@@ -1,10 +1,19 @@
+import json
+
 from django.http import HttpResponse
 from rest_framework import status
 
+AUTHENTICATION_ERRORS = (b"You do not have permission to perform this action", b"JSONWebTokenError: Token is required")
+
+
+def is_authentication_error(content: bytes) -> bool:
+    return any(error in content for error in AUTHENTICATION_ERRORS)
+
 
 class GraphQlAuthenticationStatusCodeMiddleware(object):
     """
     Django middleware that sets the HTTP status code to 401 if the authentication failed.
+    In batches only the status of the failed operations is set, the results of the others are kept.
     """
 
     def __init__(self, get_response):
@@ -12,9 +21,15 @@ class GraphQlAuthenticationStatusCodeMiddleware(object):
 
     def __call__(self, request):
         response = self.get_response(request)
-        if type(response) is HttpResponse and \
-                (b"You do not have permission to perform this action" in response.content \
-                 or b"JSONWebTokenError: Token is required" in response.content):
-            response.status_code = status.HTTP_401_UNAUTHORIZED
-            response.content = b"{}"
+        if type(response) is not HttpResponse or not is_authentication_error(response.content):
+            return response
+        if response.content.lstrip().startswith(b"["):
+            entries = json.loads(response.content)
+            for entry in entries:
+                if is_authentication_error(json.dumps(entry).encode("utf-8")):
+                    entry["status"] = status.HTTP_401_UNAUTHORIZED
+            response.content = json.dumps(entries).encode("utf-8")
+            return response
+        response.status_code = status.HTTP_401_UNAUTHORIZED
+        response.content = b"{}"
         return response
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.4 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('opengeo', '0002_auto_20210603_0114'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='guessmodel',
+            name='distance_m',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='guessmodel',
+            name='score',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
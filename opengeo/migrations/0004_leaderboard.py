@@ -0,0 +1,52 @@
+# Generated by Django 3.2.4 on 2026-10-18 12:00
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('opengeo', '0003_guess_score'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlayerScoreModel',
+            fields=[
+                ('player', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='leaderboard_score', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('total_score', models.FloatField(default=0)),
+                ('best_game_score', models.FloatField(default=0)),
+                ('games', models.IntegerField(default=0)),
+                ('guesses', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='GameScoreModel',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('best_score', models.FloatField(default=0)),
+                ('total_score', models.FloatField(default=0)),
+                ('plays', models.IntegerField(default=0)),
+                ('game', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='scores', to='opengeo.gamemodel')),
+                ('player', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='game_scores', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='playerscoremodel',
+            index=models.Index(fields=['-total_score', 'player'], name='player_score_total_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='playerscoremodel',
+            index=models.Index(fields=['-best_game_score', 'player'], name='player_score_best_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='gamescoremodel',
+            index=models.Index(fields=['game', '-best_score', 'player'], name='game_score_best_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='gamescoremodel',
+            constraint=models.UniqueConstraint(fields=('game', 'player'), name='game_score_unique'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 3.2.4 on 2026-10-18 12:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def init_round_state(apps, schema_editor):
+    """
+    Points lobby players to their latest guess and counts their guesses in its lobby game
+    """
+    LobbyPlayerModel = apps.get_model("opengeo", "LobbyPlayerModel")
+    GuessModel = apps.get_model("opengeo", "GuessModel")
+    for lobby_player in LobbyPlayerModel.objects.all():
+        guess = GuessModel.objects.filter(player_id=lobby_player.pk).order_by("-id").first()
+        if guess is None:
+            continue
+        lobby_player.round_lobby_game_id = guess.lobby_game_id
+        lobby_player.round_index = GuessModel.objects \
+            .filter(player_id=lobby_player.pk, lobby_game_id=guess.lobby_game_id) \
+            .count()
+        lobby_player.active_guess_id = guess.id
+        lobby_player.save(update_fields=["round_lobby_game", "round_index", "active_guess"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('opengeo', '0004_leaderboard'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lobbyplayermodel',
+            name='active_guess',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='opengeo.guessmodel'),
+        ),
+        migrations.AddField(
+            model_name='lobbyplayermodel',
+            name='round_index',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='lobbyplayermodel',
+            name='round_lobby_game',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='opengeo.lobbygamemodel'),
+        ),
+        migrations.RunPython(init_round_state, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 3.2.4 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+def init_rounds(apps, schema_editor):
+    """
+    Fills in the ordered location ids and the rounds of existing games
+    """
+    GameModel = apps.get_model("opengeo", "GameModel")
+    LocationModel = apps.get_model("opengeo", "LocationModel")
+    for game in GameModel.objects.all():
+        game.location_ids = list(LocationModel.objects.filter(game_id=game.id).order_by("id")
+                                 .values_list("id", flat=True))
+        game.rounds = len(game.location_ids)
+        game.save(update_fields=["location_ids", "rounds"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('opengeo', '0005_lobbyplayer_round_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gamemodel',
+            name='location_ids',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='gamemodel',
+            name='rounds',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(init_rounds, migrations.RunPython.noop),
+    ]
@@ -1,9 +1,15 @@
+import math
+import typing
 import uuid
 
+from django.conf import settings
 from django.contrib.auth.base_user import AbstractBaseUser, BaseUserManager
-from django.db import models
+from django.db import models, transaction
 from django.db.models import TextChoices
-from django.dispatch import Signal
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from opengeo import scoring
 
 # Custom signal after multiple object updates
 post_update = Signal()
@@ -88,8 +94,35 @@ class LobbyPlayerModel(models.Model):
                               on_delete=models.CASCADE)
     state = models.CharField(choices=PlayerState.choices, max_length=20, default=PlayerState.SEARCHING_LOBBY)
     player = models.OneToOneField(PlayerModel, on_delete=models.CASCADE, related_name="lobby_player", primary_key=True)
+    # Round state in the lobby game of the latest guess, changed only with the row locked
+    round_lobby_game = models.ForeignKey("LobbyGameModel", on_delete=models.SET_NULL, related_name="+", null=True,
+                                         blank=True)
+    round_index = models.IntegerField(default=0)
+    active_guess = models.ForeignKey("GuessModel", on_delete=models.SET_NULL, related_name="+", null=True, blank=True)
     objects = MyCustomManager()
 
+    @staticmethod
+    def rewind_round(player_id: int, lobby_game_id: int) -> None:
+        """
+        Steps the round of a player back after its active guess was deleted, the round is played again and the latest
+        remaining guess becomes the active one
+        :param player_id: id of the player
+        :param lobby_game_id: id of the lobby game of the deleted guess
+        :return: None
+        """
+        with transaction.atomic():
+            lobby_player = LobbyPlayerModel.objects.select_for_update().filter(pk=player_id).first()
+            # The active guess is already set to NULL by the deletion, other rounds are left as they are
+            if lobby_player is None or lobby_player.round_lobby_game_id != lobby_game_id or \
+                    lobby_player.active_guess_id is not None or lobby_player.round_index == 0:
+                return
+            lobby_player.round_index -= 1
+            lobby_player.active_guess = GuessModel.objects \
+                .filter(player_id=player_id, lobby_game_id=lobby_game_id) \
+                .order_by("-id") \
+                .first() if lobby_player.round_index else None
+            lobby_player.save(update_fields=["round_index", "active_guess"])
+
 
 class GameModel(models.Model):
     """
@@ -99,6 +132,29 @@ class GameModel(models.Model):
     name = models.CharField(max_length=50, null=True, blank=True)
     time_limit = models.IntegerField()
     creator = models.ForeignKey(PlayerModel, on_delete=models.CASCADE, related_name="created_games")
+    # Ordered ids of the locations and their count, maintained by the location signal receivers
+    rounds = models.IntegerField(default=0)
+    location_ids = models.JSONField(default=list, blank=True)
+
+    @staticmethod
+    def sync_locations(game_ids: typing.Iterable[int]) -> None:
+        """
+        Recomputes the ordered location ids and the rounds of games after their locations changed
+        :param game_ids: ids of the games
+        :return: None
+        """
+        with transaction.atomic():
+            for game in GameModel.objects.select_for_update().filter(id__in=set(game_ids)).order_by("id"):
+                game.location_ids = list(game.locations.order_by("id").values_list("id", flat=True))
+                game.rounds = len(game.location_ids)
+                game.save(update_fields=["location_ids", "rounds"])
+
+    def is_last_location(self, location_id: int) -> bool:
+        """
+        :param location_id: id of a location of the game
+        :return: whether the location is the one of the last round
+        """
+        return bool(self.location_ids) and self.location_ids[-1] == location_id
 
 
 class LocationModel(models.Model):
@@ -110,6 +166,13 @@ class LocationModel(models.Model):
     longitude = models.FloatField()
     game = models.ForeignKey(GameModel, on_delete=models.CASCADE, related_name="locations")
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The game the location was loaded with, a location moved to another game changes both
+        instance._loaded_game_id = instance.__dict__.get("game_id")
+        return instance
+
 
 class GuessModel(models.Model):
     """
@@ -123,6 +186,23 @@ class GuessModel(models.Model):
     lobby_game = models.ForeignKey("LobbyGameModel", on_delete=models.CASCADE, related_name="guesses")
     guess_start = models.DateTimeField(auto_now_add=True)
     guess_end = models.DateTimeField(null=True, blank=True)
+    # Filled in once the guess is finished
+    distance_m = models.FloatField(null=True, blank=True)
+    score = models.FloatField(null=True, blank=True)
+
+    @staticmethod
+    def compute_scores(guesses: typing.Sequence["GuessModel"]) -> None:
+        """
+        Sets the distance and the score of guesses in one numpy pass, does not save them
+        :param guesses: guesses with their locations
+        :return: None
+        """
+        score, distance = scoring.score_distances([g.latitude for g in guesses], [g.longitude for g in guesses],
+                                                  [g.location.latitude for g in guesses],
+                                                  [g.location.longitude for g in guesses], settings.SCORING_FORMULA)
+        for guess, s, d in zip(guesses, score.tolist(), distance.tolist()):
+            guess.score = s
+            guess.distance_m = None if math.isnan(d) else d
 
 
 class LobbyGameModel(models.Model):
@@ -150,3 +230,66 @@ class LobbyModel(models.Model):
     state = models.CharField(choices=StateChoices.choices, max_length=10, default=StateChoices.OPEN)
     name = models.CharField(max_length=20, default=uuid.uuid4)
     created = models.DateTimeField(auto_now=True)
+
+
+class PlayerScoreModel(models.Model):
+    """
+    Global leaderboard entry of a player, maintained incrementally from finished guesses
+    """
+    player = models.OneToOneField(PlayerModel, on_delete=models.CASCADE, related_name="leaderboard_score", primary_key=True)
+    total_score = models.FloatField(default=0)
+    best_game_score = models.FloatField(default=0)
+    games = models.IntegerField(default=0)
+    guesses = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["-total_score", "player"], name="player_score_total_idx"),
+            models.Index(fields=["-best_game_score", "player"], name="player_score_best_idx"),
+        ]
+
+
+class GameScoreModel(models.Model):
+    """
+    Leaderboard entry of a player in a game, maintained incrementally from finished guesses
+    """
+    id = models.BigAutoField(primary_key=True)
+    game = models.ForeignKey(GameModel, on_delete=models.CASCADE, related_name="scores")
+    player = models.ForeignKey(PlayerModel, on_delete=models.CASCADE, related_name="game_scores")
+    best_score = models.FloatField(default=0)
+    total_score = models.FloatField(default=0)
+    plays = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["game", "player"], name="game_score_unique"),
+        ]
+        indexes = [
+            models.Index(fields=["game", "-best_score", "player"], name="game_score_best_idx"),
+        ]
+
+
+@receiver(post_delete, sender=GuessModel, dispatch_uid="rewind_round_guess_delete")
+def rewind_guess_round(sender, instance: GuessModel, **kwargs):
+    """
+    After a guess is deleted, rewind the round of its player if it was the active guess
+    :param sender:
+    :param instance:
+    :param kwargs:
+    :return:
+    """
+    LobbyPlayerModel.rewind_round(instance.player_id, instance.lobby_game_id)
+
+
+@receiver(post_save, sender=LocationModel, dispatch_uid="sync_locations_save")
+@receiver(post_delete, sender=LocationModel, dispatch_uid="sync_locations_delete")
+def sync_game_locations(sender, instance: LocationModel, **kwargs):
+    """
+    After a location is created, moved or deleted by any means (mutations, admin, cascades), sync its games
+    :param sender:
+    :param instance:
+    :param kwargs:
+    :return:
+    """
+    GameModel.sync_locations({instance.game_id, getattr(instance, "_loaded_game_id", None)} - {None})
+    instance._loaded_game_id = instance.game_id
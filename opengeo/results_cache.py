@@ -0,0 +1,103 @@
+import threading
+import time
+from typing import Callable, Dict, Tuple, TypeVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from opengeo.models import GuessModel
+
+"""
+Cache of final results of lobby games
+
+Entries are keyed by the lobby game id and its version, a change of a guess replaces the version once it is committed,
+so stale entries are never read again and simply expire. Entries hold the values of guesses only, related objects are
+loaded fresh by every reader. Versions and entries live in the shared default cache, so all
+workers and management commands see the same versions.
+"""
+
+T = TypeVar("T")
+
+VERSION_KEY = "final_results_version:{}"
+RESULTS_KEY = "final_results:{}:v{}"
+
+# Concurrent readers of a missing entry in one process wait for a single computation,
+# a lock is kept with the number of readers holding or waiting for it
+_locks: Dict[int, Tuple[threading.Lock, int]] = {}
+_locks_lock = threading.Lock()
+
+
+def final_results_version(lobby_game_id: int) -> int:
+    """
+    :param lobby_game_id: id of the lobby game
+    :return: current version of the results of the lobby game
+    """
+    key = VERSION_KEY.format(lobby_game_id)
+    version = cache.get(key)
+    if version is None:
+        # Start from the current time, so an evicted counter never returns to an old version
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def invalidate_final_results(lobby_game_id: int) -> None:
+    """
+    Replaces the version of the results of a lobby game
+    :param lobby_game_id: id of the lobby game
+    :return: None
+    """
+    # A new timestamp instead of incr, not every shared backend increments atomically and concurrent
+    # invalidations must never end on the old version
+    cache.set(VERSION_KEY.format(lobby_game_id), time.time_ns(), timeout=None)
+
+
+def get_final_results(lobby_game_id: int, compute: Callable[[], T]) -> T:
+    """
+    Loads the final results of a lobby game from the cache, computes them on a miss
+    :param lobby_game_id: id of the lobby game
+    :param compute: function computing the results, they have to be picklable and should be plain data,
+    cached model instances would keep changes of related models out of the results
+    :return: the results
+    """
+    key = RESULTS_KEY.format(lobby_game_id, final_results_version(lobby_game_id))
+    results = cache.get(key)
+    if results is not None:
+        return results
+    with _locks_lock:
+        lock, readers = _locks.get(lobby_game_id, (None, 0))
+        lock = lock or threading.Lock()
+        _locks[lobby_game_id] = lock, readers + 1
+    try:
+        with lock:
+            results = cache.get(key)
+            if results is None:
+                results = compute()
+                cache.set(key, results, settings.FINAL_RESULTS_CACHE_TIMEOUT)
+    finally:
+        with _locks_lock:
+            lock, readers = _locks[lobby_game_id]
+            # Removed by the last reader only, a new lock next to a waited one would let a second computation start
+            if readers == 1:
+                del _locks[lobby_game_id]
+            else:
+                _locks[lobby_game_id] = lock, readers - 1
+    return results
+
+
+@receiver(post_save, sender=GuessModel, dispatch_uid="invalidate_final_results_save")
+@receiver(post_delete, sender=GuessModel, dispatch_uid="invalidate_final_results_delete")
+def invalidate_guess_results(sender, instance: GuessModel, **kwargs):
+    """
+    After a guess is changed and committed, invalidate the results of its lobby game, an earlier invalidation would
+    let concurrent readers cache the uncommitted state under the new version
+    :param sender:
+    :param instance:
+    :param kwargs:
+    :return:
+    """
+    lobby_game_id = instance.lobby_game_id
+    transaction.on_commit(lambda: invalidate_final_results(lobby_game_id), using=kwargs.get("using"))
@@ -0,0 +1,119 @@
+import threading
+from collections import OrderedDict
+from functools import partial
+from hashlib import sha256
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from graphql import GraphQLError, GraphQLSchema
+from graphql.backend import GraphQLCoreBackend, set_default_backend
+from graphql.backend.base import GraphQLDocument
+from graphql.backend.cache import get_unique_schema_id
+from graphql.execution import execute, ExecutionResult
+from graphql.language import ast
+from graphql.language.parser import parse
+from graphql.validation import validate
+
+from opengeo.schema import metrics
+from opengeo.schema.cost import check_cost
+
+"""
+graphql-core backend with a cache of parsed and validated documents
+
+The backend is the default one of graphql-core, so the HTTP view and the websocket consumer share the cache and the
+limits of query cost and depth. Executed operations are traced for the metrics.
+"""
+
+
+def _operation_name(document_ast: ast.Document, operation_name: Optional[str]) -> Optional[str]:
+    if operation_name is not None:
+        return operation_name
+    operations = [definition for definition in document_ast.definitions
+                  if isinstance(definition, ast.OperationDefinition)]
+    if len(operations) == 1 and operations[0].name is not None:
+        return operations[0].name.value
+    return None
+
+
+def execute_validated(schema: GraphQLSchema, document_ast: ast.Document, errors: List[GraphQLError], root_value=None,
+                      context_value=None, variable_values=None, operation_name=None, **kwargs):
+    """
+    Executes a document validated in advance, operations above the cost limits are rejected before any resolver runs
+    :param schema: the schema
+    :param document_ast: the document
+    :param errors: validation errors of the document
+    :return: result of the execution, its extensions report the cost of the operation and on request its metrics
+    """
+    if errors and kwargs.get("validate", True):
+        return ExecutionResult(errors=errors, invalid=True)
+    # The websocket consumer passes the deprecated aliases
+    context = context_value if context_value is not None else kwargs.get("context")
+    variables = variable_values if variable_values is not None else kwargs.get("variables")
+    cost, cost_errors = check_cost(schema, document_ast, operation_name, variables)
+    if cost_errors:
+        return ExecutionResult(errors=cost_errors, invalid=True, extensions={"cost": cost})
+    with metrics.trace(_operation_name(document_ast, operation_name)) as operation_trace:
+        result = execute(schema, document_ast, root_value, context_value, variable_values, operation_name, **kwargs)
+    if isinstance(result, ExecutionResult):
+        if cost is not None:
+            result.extensions["cost"] = cost
+        if metrics.wants_report(context):
+            result.extensions["metrics"] = operation_trace.report()
+    return result
+
+
+class CachedDocumentBackend(GraphQLCoreBackend):
+    """
+    Keeps parsed and validated documents in a bounded LRU cache keyed by the schema and the hash of the query
+    """
+
+    def __init__(self, max_size: int = 1000, executor=None):
+        """
+        :param max_size: maximum number of cached documents
+        :param executor: default executor of the documents
+        """
+        super().__init__(executor)
+        self.max_size = max_size
+        self._documents: "OrderedDict[Tuple[str, str], GraphQLDocument]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def document_from_string(self, schema: GraphQLSchema, document_string) -> GraphQLDocument:
+        if isinstance(document_string, ast.Document):
+            return super().document_from_string(schema, document_string)
+        key = (get_unique_schema_id(schema), sha256(document_string.encode("utf-8")).hexdigest())
+        with self._lock:
+            document = self._documents.get(key)
+            if document is not None:
+                self._documents.move_to_end(key)
+                self.hits += 1
+                return document
+            self.misses += 1
+        # Syntax errors are raised to the caller and not cached
+        document_ast = parse(document_string)
+        document = GraphQLDocument(
+            schema=schema,
+            document_string=document_string,
+            document_ast=document_ast,
+            execute=partial(execute_validated, schema, document_ast, validate(schema, document_ast),
+                            **self.execute_params),
+        )
+        with self._lock:
+            self._documents[key] = document
+            while len(self._documents) > self.max_size:
+                self._documents.popitem(last=False)
+        return document
+
+    def stats(self) -> Dict:
+        """
+        :return: size, maximum size, hits, misses and hit rate of the cache
+        """
+        with self._lock:
+            requests = self.hits + self.misses
+            return {"size": len(self._documents), "max_size": self.max_size, "hits": self.hits,
+                    "misses": self.misses, "hit_rate": self.hits / requests if requests else 0.}
+
+
+document_backend = CachedDocumentBackend(settings.GRAPHQL_DOCUMENT_CACHE["MAX_SIZE"])
+set_default_backend(document_backend)
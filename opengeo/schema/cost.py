@@ -0,0 +1,167 @@
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+from django.conf import settings
+from graphene.utils.str_converters import to_snake_case
+from graphql import GraphQLError, GraphQLSchema
+from graphql.language import ast
+from graphql.type import GraphQLList, GraphQLNonNull
+
+"""
+Static cost and depth analysis of validated graphql operations
+
+Every selected field costs its weight, object fields OBJECT_COST and leaves SCALAR_COST unless the object type names
+another weight in cost_weights. The cost of a list field is multiplied by its expected size, the nearest size argument
+(e.g. limit of a paginated field or first of a leaderboard) sizes the first list at or below it, other lists count as
+DEFAULT_LIST_SIZE items. Introspection fields are free.
+"""
+
+
+def _unwrap(gql_type):
+    while hasattr(gql_type, "of_type"):
+        gql_type = gql_type.of_type
+    return gql_type
+
+
+def _is_list(gql_type) -> bool:
+    if isinstance(gql_type, GraphQLNonNull):
+        gql_type = gql_type.of_type
+    return isinstance(gql_type, GraphQLList)
+
+
+class CostAnalysis:
+    """
+    Computes the cost and the depth of one operation of a document
+    """
+
+    def __init__(self, schema: GraphQLSchema, document_ast: ast.Document, variables: Optional[Dict] = None):
+        """
+        :param schema: the schema
+        :param document_ast: validated document
+        :param variables: variables sent by the client
+        """
+        self.schema = schema
+        self.variables = variables or {}
+        self.fragments = {definition.name.value: definition for definition in document_ast.definitions
+                          if isinstance(definition, ast.FragmentDefinition)}
+        self.operations = [definition for definition in document_ast.definitions
+                           if isinstance(definition, ast.OperationDefinition)]
+        self.config = settings.QUERY_COST
+
+    def operation(self, operation_name: Optional[str]) -> Optional[ast.OperationDefinition]:
+        """
+        :param operation_name: name of the executed operation, may be None for documents with one operation
+        :return: the executed operation, None if it does not exist
+        """
+        if operation_name is None:
+            return self.operations[0] if len(self.operations) == 1 else None
+        return next((operation for operation in self.operations
+                     if operation.name is not None and operation.name.value == operation_name), None)
+
+    def analyze(self, operation_name: Optional[str] = None) -> Optional[Tuple[float, int]]:
+        """
+        :param operation_name: name of the executed operation
+        :return: (cost, depth) of the operation, None if it does not exist and execution will report it
+        """
+        operation = self.operation(operation_name)
+        if operation is None:
+            return None
+        root_type = {"query": self.schema.get_query_type, "mutation": self.schema.get_mutation_type,
+                     "subscription": self.schema.get_subscription_type}[operation.operation]()
+        return self._selection_cost(root_type, operation.selection_set, 0, None)
+
+    def _fields(self, parent_type, selection_set: ast.SelectionSet) -> Iterator[Tuple[object, ast.Field]]:
+        """
+        Flattens a selection set with fragments to the selected fields and the types they are selected on
+        """
+        for selection in selection_set.selections:
+            if isinstance(selection, ast.Field):
+                yield parent_type, selection
+                continue
+            if isinstance(selection, ast.FragmentSpread):
+                selection = self.fragments[selection.name.value]
+            fragment_type = self.schema.get_type(selection.type_condition.name.value) \
+                if selection.type_condition is not None else parent_type
+            yield from self._fields(fragment_type, selection.selection_set)
+
+    def _selection_cost(self, parent_type, selection_set: ast.SelectionSet, depth: int,
+                        size: Optional[int]) -> Tuple[float, int]:
+        """
+        :param parent_type: graphql type of the selected object
+        :param selection_set: selection of the object
+        :param depth: depth of the object
+        :param size: size of the first list below the object, None if no argument sized it
+        :return: (cost, depth) of the selection
+        """
+        cost, max_depth = 0., depth
+        for field_type, field_ast in self._fields(parent_type, selection_set):
+            if field_ast.name.value.startswith("__"):
+                continue
+            field_cost, field_depth = self._field_cost(field_type, field_ast, depth + 1, size)
+            cost += field_cost
+            max_depth = max(max_depth, field_depth)
+        return cost, max_depth
+
+    def _field_cost(self, parent_type, field_ast: ast.Field, depth: int, size: Optional[int]) -> Tuple[float, int]:
+        field = parent_type.fields[field_ast.name.value]
+        size = self._size(field, field_ast) or size
+        graphene_type = getattr(parent_type, "graphene_type", None)
+        weights = getattr(graphene_type, "cost_weights", {})
+        weight = weights.get(to_snake_case(field_ast.name.value),
+                             self.config["OBJECT_COST"] if field_ast.selection_set else self.config["SCALAR_COST"])
+        multiplier = 1
+        if _is_list(field.type):
+            multiplier = size or self.config["DEFAULT_LIST_SIZE"]
+            size = None
+        if not field_ast.selection_set:
+            return multiplier * weight, depth
+        cost, max_depth = self._selection_cost(_unwrap(field.type), field_ast.selection_set, depth, size)
+        return multiplier * (weight + cost), max_depth
+
+    def _size(self, field, field_ast: ast.Field) -> Optional[int]:
+        """
+        :param field: definition of the field
+        :param field_ast: the selected field
+        :return: value of the first size argument of the field, capped to its maximum
+        """
+        arguments = {argument.name.value: argument.value for argument in field_ast.arguments}
+        for name, maximum in self.config["SIZE_ARGUMENTS"].items():
+            if name not in field.args:
+                continue
+            value = arguments.get(name)
+            if isinstance(value, ast.Variable):
+                value = self.variables.get(value.name.value)
+            elif isinstance(value, ast.IntValue):
+                value = int(value.value)
+            else:
+                value = None
+            if value is None:
+                value = field.args[name].default_value
+            if isinstance(value, int) and value > 0:
+                return min(value, maximum) if maximum is not None else value
+        return None
+
+
+def check_cost(schema: GraphQLSchema, document_ast: ast.Document, operation_name: Optional[str] = None,
+               variables: Optional[Dict] = None) -> Tuple[Optional[Dict], Iterable[GraphQLError]]:
+    """
+    Rejects operations above the configured depth and cost
+    :param schema: the schema
+    :param document_ast: validated document
+    :param operation_name: name of the executed operation
+    :param variables: variables sent by the client
+    :return: ({"cost": , "depth": , "max_cost": , "max_depth": } or None if the operation does not exist, errors)
+    """
+    analysis = CostAnalysis(schema, document_ast, variables).analyze(operation_name)
+    if analysis is None:
+        return None, []
+    cost, depth = analysis
+    config = settings.QUERY_COST
+    report = {"cost": cost, "depth": depth, "max_cost": config["MAX_COST"], "max_depth": config["MAX_DEPTH"]}
+    errors = []
+    if depth > config["MAX_DEPTH"]:
+        errors.append(GraphQLError(f"Query depth {depth} exceeds the maximum depth {config['MAX_DEPTH']}",
+                                   extensions={"code": "QUERY_TOO_DEEP"}))
+    if cost > config["MAX_COST"]:
+        errors.append(GraphQLError(f"Query cost {cost:g} exceeds the maximum cost {config['MAX_COST']}",
+                                   extensions={"code": "QUERY_TOO_COSTLY"}))
+    return report, errors
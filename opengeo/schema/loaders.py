@@ -0,0 +1,159 @@
+from collections import defaultdict
+from typing import Dict, Optional, Tuple, Type
+
+from django.db.models import Model
+from django.http import HttpRequest
+from graphene_django_extras import DjangoFilterListField
+from graphql import ResolveInfo
+from promise import Promise
+from promise.dataloader import DataLoader
+
+"""
+Per-request DataLoaders batching the relation resolvers of the object types
+
+Loaders live on the HTTP request, so siblings of one query share a single IN query per relation. Websocket contexts
+outlive a single operation, there the relations are loaded directly to never serve stale objects.
+"""
+
+
+class ModelLoader(DataLoader):
+    """
+    Loads model instances by their primary keys
+    """
+
+    def __init__(self, model: Type[Model]):
+        super().__init__()
+        self.model = model
+
+    def batch_load_fn(self, keys):
+        objects = self.model.objects.in_bulk(keys)
+        return Promise.resolve([objects.get(key) for key in keys])
+
+
+class RelatedListLoader(DataLoader):
+    """
+    Loads lists of model instances by the value of their foreign key, ordered by their primary keys
+    """
+
+    def __init__(self, model: Type[Model], field: str):
+        """
+        :param model: model of the loaded instances
+        :param field: attribute name of the foreign key, e.g. lobby_id
+        """
+        super().__init__()
+        self.model = model
+        self.field = field
+
+    def batch_load_fn(self, keys):
+        groups = defaultdict(list)
+        for obj in self.model.objects.filter(**{f"{self.field}__in": keys}).order_by("pk"):
+            groups[getattr(obj, self.field)].append(obj)
+        return Promise.resolve([groups.get(key, []) for key in keys])
+
+
+class Loaders:
+    """
+    DataLoaders of one request, created on first use
+    """
+
+    def __init__(self):
+        self._models: Dict[Type[Model], ModelLoader] = {}
+        self._related: Dict[Tuple[Type[Model], str], RelatedListLoader] = {}
+
+    def model(self, model: Type[Model]) -> ModelLoader:
+        if model not in self._models:
+            self._models[model] = ModelLoader(model)
+        return self._models[model]
+
+    def related(self, model: Type[Model], field: str) -> RelatedListLoader:
+        if (model, field) not in self._related:
+            self._related[(model, field)] = RelatedListLoader(model, field)
+        return self._related[(model, field)]
+
+
+def get_loaders(info: ResolveInfo) -> Optional[Loaders]:
+    """
+    :param info: resolve info of a field
+    :return: loaders of the HTTP request or None outside of HTTP requests
+    """
+    if not isinstance(info.context, HttpRequest):
+        return None
+    loaders = getattr(info.context, "loaders", None)
+    if loaders is None:
+        loaders = info.context.loaders = Loaders()
+    return loaders
+
+
+def load_model(info: ResolveInfo, model: Type[Model], pk):
+    """
+    Loads a model instance by its primary key
+    :param info: resolve info of the field
+    :param model: model of the instance
+    :param pk: primary key, may be None
+    :return: promise of the instance, the instance itself outside of HTTP requests
+    """
+    if pk is None:
+        return None
+    loaders = get_loaders(info)
+    if loaders is None:
+        return model.objects.filter(pk=pk).first()
+    return loaders.model(model).load(pk)
+
+
+def load_related(info: ResolveInfo, model: Type[Model], field: str, key):
+    """
+    Loads the model instances referencing a key
+    :param info: resolve info of the field
+    :param model: model of the instances
+    :param field: attribute name of the foreign key
+    :param key: value of the foreign key
+    :return: promise of the list of instances, the list itself outside of HTTP requests
+    """
+    loaders = get_loaders(info)
+    if loaders is None:
+        return list(model.objects.filter(**{field: key}).order_by("pk"))
+    return loaders.related(model, field).load(key)
+
+
+def load_relation(info: ResolveInfo, instance: Model, name: str):
+    """
+    Loads a foreign key or a reverse foreign key of a model instance, objects already fetched by select_related or
+    prefetch_related are reused
+    :param info: resolve info of the field
+    :param instance: the model instance
+    :param name: name of the relation, the related name for reverse relations
+    :return: promise of the related instance or list, the value itself when it is known or outside of HTTP requests
+    """
+    field = instance._meta.get_field(name)
+    if field.one_to_many:
+        accessor = field.get_accessor_name()
+        if accessor in getattr(instance, "_prefetched_objects_cache", {}):
+            return list(getattr(instance, accessor).all())
+        return load_related(info, field.related_model, field.field.attname, instance.pk)
+    if field.is_cached(instance):
+        return getattr(instance, name)
+    return load_model(info, field.related_model, getattr(instance, field.attname))
+
+
+class RelatedDjangoFilterListField(DjangoFilterListField):
+    """
+    Filter list field of a reverse relation, unfiltered lists are batched with a DataLoader
+    """
+
+    def __init__(self, _type, related_name: str, *args, **kwargs):
+        """
+        :param _type: object type of the list
+        :param related_name: name of the reverse relation on the parent model
+        """
+        super().__init__(_type, *args, **kwargs)
+        self.related_name = related_name
+
+    def get_resolver(self, parent_resolver):
+        list_resolver = super().get_resolver(parent_resolver)
+
+        def resolver(root, info, **kwargs):
+            if root is None or any(value is not None for value in kwargs.values()):
+                return list_resolver(root, info, **kwargs)
+            return load_relation(info, root, self.related_name)
+
+        return resolver
@@ -0,0 +1,254 @@
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+from django.db import connection
+from django.http import HttpRequest
+from graphql import ResolveInfo
+
+"""
+Timing and SQL instrumentation of graphql operations
+
+Every operation is traced: the middleware times the resolvers by their field path and a database execute wrapper
+attributes SQL queries to the field resolving at that moment. Finished traces are aggregated into in-process
+histograms served in the Prometheus text format, every worker process keeps its own.
+"""
+
+OTHER = "__other__"
+
+
+class Histogram:
+    """
+    Cumulative histogram of observed values
+    """
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """
+    Histograms and counters keyed by the metric name and the label values, new label values above max_series are
+    merged into one series of OTHER labels
+    """
+
+    def __init__(self, max_series: int = 1000):
+        self.max_series = max_series
+        self._lock = threading.Lock()
+        self._help: Dict[str, Tuple[str, Tuple[str, ...]]] = {}
+        self._buckets: Dict[str, Sequence[float]] = {}
+        self._histograms: Dict[str, Dict[Tuple[str, ...], Histogram]] = defaultdict(dict)
+        self._counters: Dict[str, Dict[Tuple[str, ...], float]] = defaultdict(dict)
+
+    def histogram(self, name: str, description: str, labels: Tuple[str, ...], buckets: Sequence[float]) -> None:
+        self._help[name] = (description, labels)
+        self._buckets[name] = buckets
+
+    def counter(self, name: str, description: str, labels: Tuple[str, ...]) -> None:
+        self._help[name] = (description, labels)
+
+    def _series(self, series: Dict, labels: Tuple[str, ...]) -> Tuple[str, ...]:
+        if labels in series or len(series) < self.max_series:
+            return labels
+        return (OTHER,) * len(labels)
+
+    def record(self, observations: List[Tuple[str, Tuple[str, ...], float]],
+               increments: List[Tuple[str, Tuple[str, ...], float]]) -> None:
+        """
+        Records the metrics of one operation at once
+        :param observations: (histogram name, label values, value)
+        :param increments: (counter name, label values, increment)
+        :return: None
+        """
+        with self._lock:
+            for name, labels, value in observations:
+                series = self._histograms[name]
+                labels = self._series(series, labels)
+                if labels not in series:
+                    series[labels] = Histogram(self._buckets[name])
+                series[labels].observe(value)
+            for name, labels, value in increments:
+                series = self._counters[name]
+                labels = self._series(series, labels)
+                series[labels] = series.get(labels, 0.) + value
+
+    def render(self) -> str:
+        """
+        :return: all metrics in the Prometheus text format
+        """
+        lines = []
+        with self._lock:
+            for name, (description, label_names) in self._help.items():
+                if name in self._buckets:
+                    lines += [f"# HELP {name} {description}", f"# TYPE {name} histogram"]
+                    for labels, histogram in self._histograms[name].items():
+                        cumulative = 0
+                        for bound, count in zip([*histogram.buckets, float("inf")], histogram.counts):
+                            cumulative += count
+                            le = "+Inf" if bound == float("inf") else repr(float(bound))
+                            lines.append(f"{name}_bucket{_labels(label_names, labels, le)} {cumulative}")
+                        lines.append(f"{name}_sum{_labels(label_names, labels)} {histogram.sum!r}")
+                        lines.append(f"{name}_count{_labels(label_names, labels)} {histogram.count}")
+                else:
+                    lines += [f"# HELP {name} {description}", f"# TYPE {name} counter"]
+                    for labels, value in self._counters[name].items():
+                        lines.append(f"{name}{_labels(label_names, labels)} {value!r}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], le: Optional[str] = None) -> str:
+    pairs = list(zip(names, values))
+    if le is not None:
+        pairs.append(("le", le))
+    escaped = (name + '="' + value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+               for name, value in pairs)
+    return "{" + ",".join(escaped) + "}" if pairs else ""
+
+
+config = settings.GRAPHQL_METRICS
+registry = Registry(config["MAX_SERIES"])
+registry.histogram("graphql_operation_duration_seconds", "Wall time of graphql operations", ("operation",),
+                   config["DURATION_BUCKETS"])
+registry.histogram("graphql_operation_resolvers", "Resolvers called by graphql operations", ("operation",),
+                   config["COUNT_BUCKETS"])
+registry.histogram("graphql_operation_sql_queries", "SQL queries of graphql operations", ("operation",),
+                   config["COUNT_BUCKETS"])
+registry.histogram("graphql_operation_sql_duration_seconds", "Time of the SQL queries of graphql operations",
+                   ("operation",), config["DURATION_BUCKETS"])
+registry.histogram("graphql_field_duration_seconds", "Wall time of single resolver calls, without their children",
+                   ("operation", "path"), config["DURATION_BUCKETS"])
+registry.counter("graphql_field_sql_queries_total", "SQL queries issued while resolving a field",
+                 ("operation", "path"))
+registry.counter("graphql_field_sql_duration_seconds_total", "Time of the SQL queries issued while resolving a field",
+                 ("operation", "path"))
+
+
+class _FieldStats:
+    __slots__ = "durations", "sql_queries", "sql_duration"
+
+    def __init__(self):
+        self.durations: List[float] = []
+        self.sql_queries = 0
+        self.sql_duration = 0.
+
+
+class Trace:
+    """
+    Measurements of one operation, SQL outside of resolvers (e.g. batched DataLoaders) counts for the operation only
+    """
+
+    def __init__(self, operation: str):
+        self.operation = operation
+        self.duration = 0.
+        self.sql_queries = 0
+        self.sql_duration = 0.
+        self.fields: Dict[str, _FieldStats] = defaultdict(_FieldStats)
+        self._path: Optional[str] = None
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.sql_queries += 1
+            self.sql_duration += duration
+            if self._path is not None:
+                stats = self.fields[self._path]
+                stats.sql_queries += 1
+                stats.sql_duration += duration
+
+    def resolve(self, path: str, next_resolver, root, info: ResolveInfo, **args):
+        parent_path, self._path = self._path, path
+        start = time.perf_counter()
+        try:
+            return next_resolver(root, info, **args)
+        finally:
+            self.fields[path].durations.append(time.perf_counter() - start)
+            self._path = parent_path
+
+    def record(self) -> None:
+        operation = (self.operation,)
+        observations = [("graphql_operation_duration_seconds", operation, self.duration),
+                        ("graphql_operation_resolvers", operation, sum(len(f.durations) for f in self.fields.values())),
+                        ("graphql_operation_sql_queries", operation, self.sql_queries),
+                        ("graphql_operation_sql_duration_seconds", operation, self.sql_duration)]
+        increments = []
+        for path, stats in self.fields.items():
+            labels = (self.operation, path)
+            observations += [("graphql_field_duration_seconds", labels, duration) for duration in stats.durations]
+            if stats.sql_queries:
+                increments += [("graphql_field_sql_queries_total", labels, stats.sql_queries),
+                               ("graphql_field_sql_duration_seconds_total", labels, stats.sql_duration)]
+        registry.record(observations, increments)
+
+    def report(self) -> Dict:
+        """
+        :return: breakdown of the operation for the response extensions
+        """
+        return {
+            "operation": self.operation,
+            "duration": self.duration,
+            "resolvers": sum(len(stats.durations) for stats in self.fields.values()),
+            "sql": {"queries": self.sql_queries, "duration": self.sql_duration},
+            "fields": {path: {"resolvers": len(stats.durations), "duration": sum(stats.durations),
+                              "sql_queries": stats.sql_queries, "sql_duration": stats.sql_duration}
+                       for path, stats in self.fields.items()},
+        }
+
+
+_local = threading.local()
+
+
+@contextmanager
+def trace(operation: Optional[str]):
+    """
+    Traces an operation executed in the current thread and records it when it finishes
+    :param operation: name of the operation, None for anonymous operations
+    :return: context manager yielding the trace
+    """
+    current = Trace(operation or "anonymous")
+    parent, _local.trace = getattr(_local, "trace", None), current
+    start = time.perf_counter()
+    try:
+        with connection.execute_wrapper(current.execute_wrapper):
+            yield current
+    finally:
+        current.duration = time.perf_counter() - start
+        _local.trace = parent
+        current.record()
+
+
+def wants_report(context) -> bool:
+    """
+    :param context: context of the operation, the HTTP request for the graphql view
+    :return: whether the client asked for the breakdown in the response extensions
+    """
+    header = config["DEBUG_HEADER"]
+    return header is not None and isinstance(context, HttpRequest) and bool(context.headers.get(header))
+
+
+class MetricsMiddleware:
+    """
+    Graphene middleware timing the resolvers of traced operations
+    """
+
+    def resolve(self, next, root, info: ResolveInfo, **args):
+        current = getattr(_local, "trace", None)
+        if current is None:
+            return next(root, info, **args)
+        # List indices are left out, so all items of a list share the series of the field
+        path = ".".join(key for key in info.path if isinstance(key, str))
+        return current.resolve(path, next, root, info, **args)
@@ -1,6 +1,7 @@
 from logging import getLogger
 
 from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
 from django.db.models import Q
 from graphene import ObjectType, Field, Mutation, List, String, Boolean
 from graphene_django.types import ErrorType
@@ -8,6 +9,7 @@ from graphene_django_extras import DjangoSerializerMutation, LimitOffsetGraphqlP
 from graphql_jwt import Refresh, Verify, ObtainJSONWebToken, DeleteJSONWebTokenCookie
 from graphql_jwt.decorators import login_required
 
+from opengeo import leaderboard
 from opengeo.models import LobbyModel, LocationModel, LobbyPlayerModel, GuessModel, PlayerModel
 from opengeo.schema.object_types import Location, LobbyPlayer, PlayerRegisterType, LocationInput
 from opengeo.schema.subscription import LobbyUpdateSubscription
@@ -153,7 +155,7 @@ class GuessUpdateSerializerMutation(DjangoSerializerMutation):
         response = super().update(root, info, **kwargs)
         if response.ok:
             if response.guessmodel.guess_end:
-                if response.guessmodel.location.game.locations.last() == response.guessmodel.location:
+                if response.guessmodel.location.game.is_last_location(response.guessmodel.location_id):
                     response.guessmodel.player.state = LobbyPlayerModel.PlayerState.AFTER_GAME
                 else:
                     response.guessmodel.player.state = LobbyPlayerModel.PlayerState.WAITING_NEXT_ROUND
@@ -163,12 +165,19 @@ class GuessUpdateSerializerMutation(DjangoSerializerMutation):
     @classmethod
     def save(cls, serialized_obj: GuessSerializer, root, info, **kwargs):
         if serialized_obj.is_valid():
-            if serialized_obj.instance.guess_end is None:
+            with transaction.atomic():
+                # The lock on the author serializes concurrent updates of the guess
+                LobbyPlayerModel.objects.select_for_update().get(pk=serialized_obj.instance.player_id)
+                serialized_obj.instance.refresh_from_db(fields=["guess_end"])
+                if serialized_obj.instance.guess_end is not None:
+                    return False, [ErrorType(field="guess_end", messages=["Cannot update a finished guess"])]
                 # Save only valid and UNFINISHED
                 obj = serialized_obj.save()
+                if obj.guess_end:
+                    GuessModel.compute_scores([obj])
+                    obj.save(update_fields=["distance_m", "score"])
+                    leaderboard.record_guess(obj)
                 return True, obj
-            else:
-                return False, [ErrorType(field="guess_end", messages=["Cannot update a finished guess"])]
         else:
             errors = [
                 ErrorType(field=key, messages=value)
@@ -195,7 +204,7 @@ class GuessCreateSerializerMutation(DjangoSerializerMutation):
         :return: None
         """
         if guess.guess_end:
-            if guess.location.game.locations.last() == guess.location:
+            if guess.location.game.is_last_location(guess.location_id):
                 lobby_player.state = LobbyPlayerModel.PlayerState.AFTER_GAME
             else:
                 lobby_player.state = LobbyPlayerModel.PlayerState.WAITING_NEXT_ROUND
@@ -213,20 +222,33 @@ class GuessCreateSerializerMutation(DjangoSerializerMutation):
     def save(cls, serialized_obj: GuessSerializer, root, info, **kwargs):
         if serialized_obj.is_valid():
             lobby_game = serialized_obj.validated_data['lobby_game']
-            locations = lobby_game.game.locations.all()
-            # Guesses made by the author in the specific game
-            guessed = serialized_obj.validated_data['player'].guesses.filter(lobby_game_id=lobby_game.id).all()
-            # Do not create a guess if there is a pending one
-            if len(guessed) >= 1 and guessed[len(guessed) - 1].guess_end is None:
-                return False, [
-                    ErrorType(field="id", messages=["Cannot create a new guess when an old one is pending."])]
-            loc = None if len(locations) <= len(guessed) else locations[len(guessed)]
-            # No more locations in the game
-            if loc is None:
-                return False, [ErrorType(field="location", messages=["No location remaining."])]
-            new_serializer = GuessSerializer(data={**serialized_obj.data, "location": loc.id})
-            new_serializer.is_valid(True)
-            return True, new_serializer.save()
+            with transaction.atomic():
+                # The lock on the author prevents concurrent creation of pending guesses
+                lobby_player = LobbyPlayerModel.objects \
+                    .select_for_update() \
+                    .select_related("active_guess") \
+                    .get(pk=serialized_obj.validated_data['player'].pk)
+                if lobby_player.round_lobby_game_id != lobby_game.id:
+                    # First guess in this lobby game
+                    lobby_player.round_lobby_game = lobby_game
+                    lobby_player.round_index = 0
+                    lobby_player.active_guess = None
+                # Do not create a guess if there is a pending one
+                if lobby_player.active_guess is not None and lobby_player.active_guess.guess_end is None:
+                    return False, [
+                        ErrorType(field="id", messages=["Cannot create a new guess when an old one is pending."])]
+                # No more locations in the game, the ids are checked themselves as locations may have been removed
+                location_ids = lobby_game.game.location_ids
+                if lobby_player.round_index >= len(location_ids):
+                    return False, [ErrorType(field="location", messages=["No location remaining."])]
+                location_id = location_ids[lobby_player.round_index]
+                new_serializer = GuessSerializer(data={**serialized_obj.data, "location": location_id})
+                new_serializer.is_valid(True)
+                guess = new_serializer.save()
+                lobby_player.round_index += 1
+                lobby_player.active_guess = guess
+                lobby_player.save(update_fields=["round_lobby_game", "round_index", "active_guess"])
+                return True, guess
         else:
             errors = [
                 ErrorType(field=key, messages=value)
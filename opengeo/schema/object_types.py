@@ -1,7 +1,9 @@
-from graphene import Int, Field, InputObjectType, Float, ID, ObjectType, List
-from graphene_django_extras import DjangoObjectType, DjangoFilterListField, LimitOffsetGraphqlPagination
+from graphene import Int, Field, InputObjectType, Float, ID, ObjectType, List, Enum, String
+from graphene_django_extras import DjangoObjectType, LimitOffsetGraphqlPagination
 
 from opengeo.models import *
+from opengeo.schema.loaders import load_related, load_relation, RelatedDjangoFilterListField
+from opengeo.schema.optimizer import optimize
 from opengeo.schema.utils import get_player_id, UNAUTHORIZED
 
 """
@@ -18,25 +20,34 @@ class PlayerRegisterType(DjangoObjectType):
 
 class LobbyPlayer(DjangoObjectType):
     id = Int()
+    # Columns read by custom resolvers, for the query optimizer
+    optimizer_requires = {"id": ["player"]}
 
     class Meta:
         description = "Type definition for lobby players relation"
         model = LobbyPlayerModel
         pagination = LimitOffsetGraphqlPagination(default_limit=30)
+        exclude_fields = ["round_lobby_game", "active_guess"]
 
     def resolve_guesses(self, info):
         if get_player_id(info) != str(self.player_id):
             return [UNAUTHORIZED]
-        return self.guesses.all()
+        return load_relation(info, self, "guesses")
 
     def resolve_created_games(self, info):
         if get_player_id(info) != str(self.player_id):
             return [UNAUTHORIZED]
-        return self.created_games.all()
+        return load_related(info, GameModel, "creator_id", self.player_id)
 
     def resolve_id(self, info):
         return self.player_id
 
+    def resolve_player(self, info):
+        return load_relation(info, self, "player")
+
+    def resolve_lobby(self, info):
+        return load_relation(info, self, "lobby")
+
 
 class Player(DjangoObjectType):
     class Meta:
@@ -54,10 +65,18 @@ class Location(DjangoObjectType):
 
     @staticmethod
     def get_queryset(query, info, *args, **kwargs):
-        return list(query)
+        return list(optimize(query, info))
+
+    def resolve_game(self, info):
+        return load_relation(info, self, "game")
+
+    def resolve_guesses(self, info):
+        return load_relation(info, self, "guesses")
 
 
 class Guess(DjangoObjectType):
+    optimizer_requires = {"location": ["player", "guess_end"]}
+
     class Meta:
         description = "Type definition for one guess"
         model = GuessModel
@@ -68,11 +87,17 @@ class Guess(DjangoObjectType):
             return UNAUTHORIZED
         if not self.guess_end:
             return None
-        return self.location
+        return load_relation(info, self, "location")
+
+    def resolve_player(self, info):
+        return load_relation(info, self, "player")
+
+    def resolve_lobby_game(self, info):
+        return load_relation(info, self, "lobby_game")
 
     @staticmethod
     def get_queryset(query, info, *args, **kwargs):
-        return list(query)
+        return list(optimize(query, info))
 
 
 class Game(DjangoObjectType):
@@ -82,14 +107,17 @@ class Game(DjangoObjectType):
         description = "Type definition for one game"
         model = GameModel
         pagination = LimitOffsetGraphqlPagination(default_limit=30)
-        exclude_fields = ["locations"]
+        exclude_fields = ["locations", "location_ids"]
 
     @staticmethod
     def get_queryset(query, info, *args, **kwargs):
-        return list(query)
+        return list(optimize(query, info))
+
+    def resolve_creator(self, info):
+        return load_relation(info, self, "creator")
 
-    def resolve_rounds(self, info, *args, **kwargs):
-        return LocationModel.objects.filter(game__id__exact=self.id).count()
+    def resolve_game_lobbies(self, info):
+        return load_relation(info, self, "game_lobbies")
 
 
 class LobbyGame(DjangoObjectType):
@@ -103,11 +131,14 @@ class LobbyGame(DjangoObjectType):
 
     @staticmethod
     def get_queryset(query, info, *args, **kwargs):
-        return list(query)
+        return list(optimize(query, info))
+
+    def resolve_game(self, info):
+        return load_relation(info, self, "game")
 
 
 class Lobby(DjangoObjectType):
-    lobby_players = DjangoFilterListField(LobbyPlayer)
+    lobby_players = RelatedDjangoFilterListField(LobbyPlayer, "lobby_players")
     owner = Field(Player)
     id = Int()
 
@@ -122,7 +153,13 @@ class Lobby(DjangoObjectType):
 
     @staticmethod
     def get_queryset(query, info, *args, **kwargs):
-        return list(query)
+        return list(optimize(query, info))
+
+    def resolve_owner(self, info):
+        return load_relation(info, self, "owner")
+
+    def resolve_lobby_game(self, info):
+        return load_relation(info, self, "lobby_game")
 
 
 """
@@ -136,18 +173,63 @@ class LocationInput(InputObjectType):
     game = ID()
 
 
+class CoordinateInput(InputObjectType):
+    latitude = Float(required=True)
+    longitude = Float(required=True)
+
+
+class BoundingBoxInput(InputObjectType):
+    min_latitude = Float(required=True)
+    min_longitude = Float(required=True)
+    max_latitude = Float(required=True)
+    max_longitude = Float(required=True)
+
+
 class CurrentGame(ObjectType):
     location = Field(Location)
     lobby_game = Field(LobbyGame)
     round_number = Int()
 
 
+class LocationWeighting(Enum):
+    """
+    Weighting of random locations within a population density range
+    """
+    UNIFORM = "uniform"
+    POPULATION = "population"
+    LOG_POPULATION = "log_population"
+
+
 class RandomLocation(ObjectType):
     latitude = Float()
     longitude = Float()
     population_density = Int()
 
 
+class LocationPoolStats(ObjectType):
+    """
+    State of one preset of the location pool
+    """
+    min_density = Int()
+    max_density = Int()
+    weighting = LocationWeighting()
+    difficulty = Int()
+    size = Int()
+    hits = Int()
+    misses = Int()
+
+
+class DocumentCacheStats(ObjectType):
+    """
+    State of the cache of parsed and validated graphql documents
+    """
+    size = Int()
+    max_size = Int()
+    hits = Int()
+    misses = Int()
+    hit_rate = Float()
+
+
 class Result(ObjectType):
     """
     A single result for a player
@@ -184,3 +266,29 @@ class FinalResults(ObjectType):
     total_score = Int()
     results = List(FinalResult)
     locations = List(Location)
+
+
+class LeaderboardOrder(Enum):
+    """
+    Score the global leaderboard is sorted by
+    """
+    TOTAL_SCORE = "total_score"
+    BEST_GAME_SCORE = "best_game_score"
+
+
+class LeaderboardEntry(ObjectType):
+    """
+    Scores of a player in a leaderboard
+    """
+    player = Field(Player)
+    total_score = Int()
+    best_score = Int()
+    games = Int()
+
+
+class Leaderboard(ObjectType):
+    """
+    One page of a leaderboard, next_cursor is null on the last page
+    """
+    entries = List(LeaderboardEntry)
+    next_cursor = String()
@@ -0,0 +1,146 @@
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch, QuerySet
+from graphene.utils.str_converters import to_camel_case
+from graphql import ResolveInfo
+from graphql.language.ast import Field as FieldAST, FragmentSpread, InlineFragment
+
+"""
+Query optimizer driven by the selection set of a graphql field
+
+Selected foreign keys become select_related, selected reverse relations prefetch_related with their own optimized
+querysets and only the selected columns are loaded. Object types name the columns their custom resolvers read in
+optimizer_requires, a type with other unknown fields is loaded with all its columns.
+"""
+
+
+def _unwrap(gql_type):
+    while hasattr(gql_type, "of_type"):
+        gql_type = gql_type.of_type
+    return gql_type
+
+
+def _selected_fields(selection_sets: Iterable, fragments: Dict) -> List[FieldAST]:
+    """
+    Flattens selection sets with fragments to the selected fields
+    :param selection_sets: selection sets of one object
+    :param fragments: fragment definitions of the document
+    :return: selected fields
+    """
+    fields = []
+    for selection_set in selection_sets:
+        if selection_set is None:
+            continue
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldAST):
+                fields.append(selection)
+            elif isinstance(selection, FragmentSpread):
+                fields += _selected_fields([fragments[selection.name.value].selection_set], fragments)
+            elif isinstance(selection, InlineFragment):
+                fields += _selected_fields([selection.selection_set], fragments)
+    return fields
+
+
+class _Plan:
+    """
+    Optimizations of a queryset collected from a selection set
+    """
+
+    def __init__(self):
+        self.only: Optional[Set[str]] = set()
+        self.select_related: List[str] = []
+        self.prefetch_related: List[Prefetch] = []
+
+    def apply(self, queryset: QuerySet) -> QuerySet:
+        if self.select_related:
+            queryset = queryset.select_related(*self.select_related)
+        if self.prefetch_related:
+            queryset = queryset.prefetch_related(*self.prefetch_related)
+        if self.only is not None:
+            queryset = queryset.only(*self.only)
+        return queryset
+
+
+def _plan(model, gql_type, field_asts: List[FieldAST], fragments: Dict, plan: _Plan, prefix: str = "",
+          required: Tuple[str, ...] = ()) -> bool:
+    """
+    Adds the optimizations of one selected object to a plan
+    :param model: model of the object
+    :param gql_type: graphql object type of the object
+    :param field_asts: selected fields of the object
+    :param fragments: fragment definitions of the document
+    :param plan: plan of the root queryset
+    :param prefix: lookup path from the root model
+    :param required: columns needed regardless of the selection
+    :return: whether only the collected columns of this object may be loaded
+    """
+    graphene_type = getattr(gql_type, "graphene_type", None)
+    if graphene_type is None or not hasattr(graphene_type, "_meta"):
+        return False
+    names = {to_camel_case(name): name for name in graphene_type._meta.fields}
+    hints = getattr(graphene_type, "optimizer_requires", {})
+    columns = {model._meta.pk.name, *required}
+    deferrable = True
+    for field_ast in _selected_fields([ast.selection_set for ast in field_asts], fragments):
+        name = names.get(field_ast.name.value, field_ast.name.value)
+        columns.update(hints.get(name, ()))
+        try:
+            model_field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            if name not in hints and name != "__typename":
+                # Columns read by an unknown resolver cannot be guessed
+                deferrable = False
+            continue
+        if not model_field.is_relation:
+            columns.add(name)
+            continue
+        selected = [ast for ast in _selected_fields([field_ast.selection_set], fragments)
+                    if ast.name.value != "__typename"]
+        if model_field.one_to_many or model_field.many_to_many:
+            if selected:
+                child_type = _unwrap(gql_type.fields[field_ast.name.value].type)
+                child_required = (model_field.field.name,) if model_field.one_to_many else ()
+                queryset = optimize_queryset(model_field.related_model.objects.order_by("pk"), child_type,
+                                             [field_ast], fragments, child_required)
+                plan.prefetch_related.append(Prefetch(prefix + model_field.get_accessor_name(), queryset=queryset))
+            continue
+        if model_field.concrete:
+            columns.add(name)
+        if selected and (model_field.concrete or model_field.one_to_one):
+            child_type = _unwrap(gql_type.fields[field_ast.name.value].type)
+            plan.select_related.append(prefix + name)
+            # Without columns of its own the related object is loaded whole
+            _plan(model_field.related_model, child_type, [field_ast], fragments, plan, f"{prefix}{name}__",
+                  () if model_field.concrete else (model_field.field.name,))
+    if deferrable and plan.only is not None:
+        plan.only.update(prefix + column for column in columns)
+    elif not prefix:
+        plan.only = None
+    return deferrable
+
+
+def optimize_queryset(queryset: QuerySet, gql_type, field_asts: List[FieldAST], fragments: Dict,
+                      required: Tuple[str, ...] = ()) -> QuerySet:
+    """
+    Optimizes a queryset for the selection of graphql fields
+    :param queryset: queryset of the objects of the fields
+    :param gql_type: graphql object type of the objects
+    :param field_asts: the fields
+    :param fragments: fragment definitions of the document
+    :param required: columns needed regardless of the selection
+    :return: the optimized queryset
+    """
+    plan = _Plan()
+    _plan(queryset.model, gql_type, field_asts, fragments, plan, required=required)
+    return plan.apply(queryset)
+
+
+def optimize(queryset: QuerySet, info: ResolveInfo) -> QuerySet:
+    """
+    Optimizes the queryset of a field for the selection of the client
+    :param queryset: queryset of the objects of the field
+    :param info: resolve info of the field
+    :return: the optimized queryset
+    """
+    return optimize_queryset(queryset, _unwrap(info.return_type), info.field_asts, info.fragments)
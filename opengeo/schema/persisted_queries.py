@@ -0,0 +1,112 @@
+import json
+import logging
+from hashlib import sha256
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from graphql import GraphQLError, GraphQLSchema
+from graphql.backend import GraphQLBackend
+
+"""
+Automatic persisted queries (the Apollo protocol) for the HTTP view and the websocket consumer
+
+Clients send the SHA-256 hash of a query in extensions.persistedQuery.sha256Hash and the query itself only after the
+server answered PersistedQueryNotFound. Registered queries are kept in a shared cache of their own (CACHES), so a query
+registered through one worker is found by all others and culling of other entries never evicts them. In allow-list mode only the operations of the allow-list are
+executed.
+"""
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY = "persisted_query:{}"
+
+
+def query_hash(query: str) -> str:
+    return sha256(query.encode("utf-8")).hexdigest()
+
+
+def _error(message: str, code: str) -> GraphQLError:
+    return GraphQLError(message, extensions={"code": code})
+
+
+class PersistedQueries:
+    """
+    Registry of persisted queries, registered queries live in the shared Django cache
+    """
+
+    def __init__(self, allow_list: Optional[Dict[str, str]] = None, timeout: Optional[int] = None,
+                 cache_alias: str = "default"):
+        """
+        :param allow_list: the only queries allowed, keyed by their hashes, None allows every query
+        :param timeout: seconds a registered query is kept, None keeps it until the cache culls it
+        :param cache_alias: alias of the cache in CACHES keeping the registered queries
+        """
+        self.allow_list = allow_list
+        self.timeout = timeout
+        self.cache_alias = cache_alias
+
+    @classmethod
+    def from_file(cls, path: Optional[str], timeout: Optional[int] = None,
+                  cache_alias: str = "default") -> "PersistedQueries":
+        """
+        :param path: JSON file with a list of queries or a {hash: query} mapping, None disables the allow-list
+        :param timeout: seconds a registered query is kept
+        :param cache_alias: alias of the cache in CACHES keeping the registered queries
+        :return: the registry
+        """
+        if path is None:
+            return cls(timeout=timeout, cache_alias=cache_alias)
+        with open(path) as file:
+            queries = json.load(file)
+        if isinstance(queries, dict):
+            queries = queries.values()
+        # The hashes are recomputed, so a stale manifest cannot map a hash to another query
+        return cls({query_hash(query): query for query in queries}, timeout, cache_alias)
+
+    def resolve(self, query: Optional[str], extensions: Optional[Dict]) -> Optional[str]:
+        """
+        Finds the query text of a request
+        :param query: query text sent by the client
+        :param extensions: extensions sent by the client
+        :return: the query text to execute
+        :raises GraphQLError: if the query cannot be executed, the message is the one of the Apollo protocol
+        """
+        persisted = (extensions or {}).get("persistedQuery")
+        if persisted is not None and persisted.get("version") != 1:
+            raise _error("PersistedQueryNotSupported", "PERSISTED_QUERY_NOT_SUPPORTED")
+        digest = persisted.get("sha256Hash") if persisted is not None else None
+        if query is not None:
+            if digest is not None and query_hash(query) != digest:
+                raise _error("provided sha does not match query", "BAD_REQUEST")
+            digest = digest or query_hash(query)
+        if self.allow_list is not None:
+            if digest not in self.allow_list:
+                raise _error("PersistedQueryNotAllowed", "PERSISTED_QUERY_NOT_ALLOWED")
+            return self.allow_list[digest]
+        if persisted is None:
+            return query
+        if query is None:
+            query = caches[self.cache_alias].get(CACHE_KEY.format(digest))
+            if query is None:
+                raise _error("PersistedQueryNotFound", "PERSISTED_QUERY_NOT_FOUND")
+            return query
+        caches[self.cache_alias].set(CACHE_KEY.format(digest), query, self.timeout)
+        return query
+
+    def precompile(self, schema: GraphQLSchema, backend: GraphQLBackend) -> None:
+        """
+        Parses and validates all operations of the allow-list, so their first requests hit the document cache
+        :param schema: the schema
+        :param backend: backend caching the documents
+        :return: None
+        """
+        for query in (self.allow_list or {}).values():
+            backend.document_from_string(schema, query)
+        if self.allow_list:
+            logger.info(f"Precompiled {len(self.allow_list)} persisted queries")
+
+
+persisted_queries = PersistedQueries.from_file(settings.PERSISTED_QUERIES["ALLOW_LIST"],
+                                               settings.PERSISTED_QUERIES["TIMEOUT"],
+                                               settings.PERSISTED_QUERIES["CACHE"])
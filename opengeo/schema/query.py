@@ -1,19 +1,25 @@
 import logging
-import random
 import typing
-from random import uniform
-from typing import Dict, Union
+from typing import Union
 
-import geoio
-import geopy.distance
 import numpy as np
 from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
-from django.db.models import Q
+from django.db.models import Sum
+from django.db.models.functions import Coalesce
 from graphene_django_extras import DjangoFilterPaginateListField, DjangoObjectField
+from graphql import GraphQLError
 from graphql_jwt.decorators import login_required
 
+from opengeo import leaderboard
+from opengeo.density import DensityIndex, RasterStore, RejectionSampler, RegionIndex, DensityPyramid, HabitationMask, \
+    NODATA, proj_to_raster, raster_to_proj, row_areas, raster_rect, compact_raster, rng
+from opengeo.location_pool import LocationPool
+from opengeo.results_cache import get_final_results
+from opengeo.schema.backend import document_backend
 from opengeo.schema.object_types import *
+from opengeo.schema.optimizer import optimize
+from opengeo.spatial import SpatialHash
 
 logger = logging.getLogger(__name__)
 
@@ -21,55 +27,231 @@ logger = logging.getLogger(__name__)
 Definitions of all graphql queries
 """
 
-# Load the population density dataset
-img = geoio.GeoImage(str((settings.BASE_DIR / "dataset.tiff").absolute()))
-geo_data = img.get_data()
-geo_data_array = np.asarray(geo_data)
-transformation_values = img.get_gdal_obj().GetGeoTransform()
+# Load the population density dataset, memory-mapped and shared by all workers
+raster_store = RasterStore(settings.BASE_DIR / "dataset.tiff")
+geo_data, transformation_values = raster_store.load()
+# Compact uint16 densities used by all queries, no-data (sea) pixels are NODATA
+geo_data_array = raster_store.array("raster_compact", lambda: compact_raster(np.asarray(geo_data)))
+# Bit-packed habitable pixels for the cheap first test
+habitation_mask = HabitationMask.cached(raster_store, geo_data_array[0])
+# Pixels sorted by density for fast lookups of density ranges
+density_index = DensityIndex.cached(raster_store, geo_data_array[0])
+# Populated land between the latitudes of random locations forms the distribution of difficulties,
+# unpopulated pixels and the antarctic and far north would otherwise make up most of it
+DIFFICULTY_LATITUDES = (-60, 80)
+difficulty_rows = np.clip(np.rint(proj_to_raster(transformation_values, 0, np.array(DIFFICULTY_LATITUDES))[1]),
+                          0, geo_data_array.shape[1]).astype(int)
+difficulty_index = density_index.restrict(1, NODATA - 1, (int(difficulty_rows.min()), int(difficulty_rows.max())),
+                                          raster_store)
+inhabited_pixels = len(difficulty_index.offsets)
+# Width of the pixel slice of a difficulty in percent of the inhabited pixels
+DIFFICULTY_WIDTH = 1
+# Summed-area tables of density bands for locations inside a region
+region_index = RegionIndex.cached(raster_store, geo_data_array[0])
+# Per-block density ranges for discarding blocks that cannot contain a density range
+density_pyramid = DensityPyramid.cached(raster_store, geo_data_array[0])
+# Batched "raycasting" over the blocks of the raster
+rejection_sampler = RejectionSampler(geo_data_array[0], transformation_values, density_pyramid, habitation_mask)
 
 
-def get_score_distance(guess: GuessModel) -> Dict[str, int]:
+def _location_weights(weight: typing.Callable[[np.ndarray], np.ndarray]) -> np.ndarray:
     """
-    Calculates the score and the distance of a guess from the target location
-    :param guess: the guess
-    :return: dictionary {"score": ,"distance": }
+    Builds cumulative weights of pixels for weighted random locations, pixel areas shrink towards the poles
+    :param weight: function converting densities to weights
+    :return: cumulative weights aligned with the density index
     """
-    distance = geopy.distance.distance((guess.latitude, guess.longitude),
-                                       (guess.location.latitude, guess.location.longitude))
-    score = 4999.91 * 0.998036 ** distance.km
-    return {"score": score, "distance": distance.m}
+    areas = row_areas(geo_data_array.shape[1], transformation_values)
+    rows = density_index.offsets // geo_data_array.shape[2]
+    return density_index.cumulative_weights(weight(density_index.densities.astype(np.float64)) * areas[rows])
 
 
-def get_population_density(lat: float, lon: float) -> float:
+# Cumulative weights for every non-uniform weighting
+location_weights = {
+    LocationWeighting.POPULATION.value: raster_store.array("weights_population",
+                                                           lambda: _location_weights(lambda d: d)),
+    LocationWeighting.LOG_POPULATION.value: raster_store.array("weights_log_population",
+                                                               lambda: _location_weights(np.log1p)),
+}
+
+
+def get_population_densities(lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """
+    Loads population densities of many geospatial coordinates at once from the dataset, so the values are exact and
+    no-data pixels keep the DATASET_NODATA value of the dataset instead of the NODATA of the compact raster
+    :param lats: Latitudes
+    :param lons: Longitudes
+    :return: array of population densities
+    """
+    x, y = proj_to_raster(transformation_values, np.asarray(lons, dtype=np.float64), np.asarray(lats, dtype=np.float64))
+    return geo_data[0, y.astype(np.intp) % geo_data.shape[1], x.astype(np.intp) % geo_data.shape[2]]
+
+
+def get_latlngs_from_xy(xs: np.ndarray, ys: np.ndarray) -> typing.Tuple[np.ndarray, np.ndarray]:
+    """
+    Converts many XY coordinates to lat,lng at once with randomness of one pixel in each direction
+    :param xs: x coordinates
+    :param ys: y coordinates
+    :return: (latitudes, longitudes) arrays
+    """
+    lngs, lats = raster_to_proj(transformation_values, xs + rng.uniform(-.5, .5, len(xs)),
+                                ys + rng.uniform(-.5, .5, len(ys)))
+    return lats, lngs
+
+
+def locations_from_xy(xs: np.ndarray, ys: np.ndarray, densities: np.ndarray) -> typing.List[RandomLocation]:
+    """
+    Creates random locations from raster pixels
+    :param xs: x coordinates
+    :param ys: y coordinates
+    :param densities: population densities of the pixels
+    :return: list of locations
+    """
+    lats, lngs = get_latlngs_from_xy(xs, ys)
+    return [RandomLocation(latitude=lat, longitude=lng, population_density=density)
+            for lat, lng, density in zip(lats.tolist(), lngs.tolist(), densities.tolist())]
+
+
+def generate_random_locations(count: int = 5, min_density: int = 5, max_density: int = 10000,
+                              weighting: str = LocationWeighting.UNIFORM.value, bounding_box=None,
+                              difficulty: int = None) -> typing.List[RandomLocation]:
+    """
+    Generates random locations
+    :param count: number of locations
+    :param min_density: minimum population density
+    :param max_density: maximum population density
+    :param weighting: weighting of the locations within the density range, ignored with a bounding box
+    :param bounding_box: region of the locations
+    :param difficulty: percentile of inhabited pixels from the most (0) to the least (100) populated,
+    replaces the density range and the weighting
+    :return: list of locations
     """
-    Loads population density based on geospatial coordinates from the dataset
-    :param lat: Latitude
-    :param lon: Longitude
-    :return: population density
+    if difficulty is not None:
+        percentile = 100 - min(max(difficulty, 0), 100)
+        if bounding_box is None:
+            # Pixels around the percentile are a contiguous, never empty slice of the density index
+            ys, xs, densities = difficulty_index.sample_percentile(percentile, DIFFICULTY_WIDTH, count,
+                                                                   inhabited_pixels)
+            return locations_from_xy(xs, ys, densities)
+        # Inside a region, densities of the slice are used as the density range
+        start, end = difficulty_index.percentile_slice(percentile, DIFFICULTY_WIDTH, count, inhabited_pixels)
+        min_density, max_density = int(difficulty_index.densities[start]), int(difficulty_index.densities[end - 1])
+    if min_density > 10000:
+        min_density = 10000
+    if max_density >= NODATA:
+        max_density = NODATA - 1
+    if weighting in location_weights and bounding_box is None:
+        # The weighting itself favours populated areas, so the whole density range is kept
+        ys, xs, densities = density_index.sample_weighted(min_density, max_density, count,
+                                                          location_weights[weighting])
+        if len(densities) > 0:
+            return locations_from_xy(xs, ys, densities)
+    if max_density - min_density > 50 and difficulty is None:
+        max_density = min_density + 50
+    if bounding_box is not None:
+        rect = raster_rect(transformation_values, geo_data_array.shape[1:], bounding_box.min_latitude,
+                           bounding_box.min_longitude, bounding_box.max_latitude, bounding_box.max_longitude)
+        # No widening of the density range, an empty region returns no locations right away
+        ys, xs, densities = region_index.sample(min_density, max_density, count, rect)
+        return locations_from_xy(xs, ys, densities)
+    results = []
+    logger.debug("Getting random locations")
+    if min_density < 4000 and count < 100 and density_index.count(min_density, max_density) > 0:
+        # Batched "raycasting", ignores antarctic and far north + sea
+        lats, longs, densities = rejection_sampler.sample(min_density, max_density, count)
+        results = [RandomLocation(latitude=lat, longitude=long, population_density=density)
+                   for lat, long, density in zip(lats.tolist(), longs.tolist(), densities.tolist())]
+        count -= len(results)
+        if count == 0:
+            return results
+        logger.debug("Raycasting did not find enough locations")
+    # Performance optimization with a binary search in the precomputed density index
+    while density_index.count(min_density, max_density) == 0:
+        # Who would do this
+        if min_density > 50:
+            min_density -= 50
+        else:
+            max_density += 50
+    # Replace if not enough results, exact duplicates should be ruled out by randomness of the resulting latlng
+    ys, xs, densities = density_index.sample(min_density, max_density, count)
+    return results + locations_from_xy(xs, ys, densities)
+
+
+def generate_separated_locations(count: int, min_separation_km: float, existing: typing.Iterable = (),
+                                 max_rounds: int = 8, **kwargs) -> typing.List[RandomLocation]:
+    """
+    Generates random locations at least min_separation_km apart from each other and from existing locations,
+    fewer locations are returned if the eligible area is too small for the separation
+    :param count: number of locations
+    :param min_separation_km: minimum great-circle distance between two locations
+    :param existing: (latitude, longitude) pairs of locations the new ones must be separated from
+    :param max_rounds: maximum number of generated batches
+    :param kwargs: arguments of generate_random_locations
+    :return: list of locations
+    """
+    spatial_hash = SpatialHash(min_separation_km)
+    spatial_hash.add_all(existing)
+    results = []
+    for _ in range(max_rounds):
+        missing = count - len(results)
+        if missing <= 0:
+            break
+        results += [location for location in generate_random_locations(count=missing, **kwargs)
+                    if spatial_hash.add_if_free(location.latitude, location.longitude)]
+    return results
+
+
+def _load_final_results(game: LobbyGameModel) -> typing.Tuple[typing.List[typing.List[dict]], typing.List[int]]:
     """
-    x, y = img.proj_to_raster(lon, lat)
-    data = geo_data[0, int(y) % geo_data.shape[1], int(x) % geo_data.shape[2]]
-    return data
+    Loads all guesses of a lobby game in one query, as plain values, so cached results never hold related objects
+    that changed since
+    :param game: the lobby game
+    :return: (field values of guesses grouped by players ordered by their total score, ids of locations of the game)
+    """
+    guesses: typing.Dict[int, typing.List[dict]] = {}
+    for guess in GuessModel.objects.filter(lobby_game_id=game.id).order_by("player_id", "id").values():
+        guesses.setdefault(guess["player_id"], []).append(guess)
+    players_guesses = sorted(guesses.values(), key=lambda g: sum(guess["score"] or 0 for guess in g), reverse=True)
+    return players_guesses, list(game.game.locations.values_list("id", flat=True))
 
 
-def get_latlng_from_xy(x: int, y: int) -> Dict[str, float]:
+def _leaderboard_page(queryset, order: str, first: int, after: typing.Optional[str]) \
+        -> typing.Tuple[typing.List, typing.Optional[str]]:
     """
-    Converts XY coordinates to lat,lng with randomness of one pixel in each direction
-    :param x: x coordinate
-    :param y: y coordinate
-    :return: {"latitude": ,"longitude": } dict
+    Reads a page of a leaderboard with the page size limited to MAX_PAGE_SIZE
+    :param queryset: entries of the leaderboard
+    :param order: score column
+    :param first: page size
+    :param after: cursor of the previous page
+    :return: (entries, cursor of the next page)
     """
-    lng, lat = (transformation_values[0] + (x + random.uniform(-.5, .5)) * transformation_values[1],
-                transformation_values[3] + (y + random.uniform(-.5, .5)) * transformation_values[5])
-    return {"latitude": lat, "longitude": lng}
+    first = max(1, min(first, settings.GRAPHENE_DJANGO_EXTRAS["MAX_PAGE_SIZE"]))
+    try:
+        return leaderboard.top(queryset, order, first, after)
+    except ValueError:
+        raise GraphQLError("Invalid leaderboard cursor")
+
+
+# Locations of popular presets generated in the background
+location_pool = LocationPool(generate_random_locations, settings.LOCATION_POOL["PRESETS"],
+                             settings.LOCATION_POOL["LOW_WATERMARK"], settings.LOCATION_POOL["HIGH_WATERMARK"],
+                             settings.LOCATION_POOL["REFILL_INTERVAL"])
 
 
 class CustomQuery:
+    # Weights of fields computed without a single indexed query, for the cost analysis
+    cost_weights = {"random_location": 5, "population_densities": 1, "results": 5, "final_results": 10}
     current_location = Field(CurrentGame, lobby_id=ID(required=True), player_id=ID(required=True))
     current_guess = Field(Guess, player_id=ID(required=True), location_id=ID(required=True))
-    random_location = List(RandomLocation, count=Int(), min_density=Int(), max_density=Int())
+    random_location = List(RandomLocation, count=Int(), min_density=Int(), max_density=Int(),
+                           weighting=LocationWeighting(), bounding_box=BoundingBoxInput(),
+                           min_separation_km=Float(), game_id=ID(), difficulty=Int())
+    location_pool_stats = List(LocationPoolStats)
+    document_cache_stats = Field(DocumentCacheStats)
+    population_densities = List(Float, coordinates=List(CoordinateInput, required=True))
     results = Field(Results, lobby_game_id=ID(required=True), location_id=ID(required=True))
     final_results = List(FinalResults, lobby_id=ID(required=True))
+    leaderboard = Field(Leaderboard, order=LeaderboardOrder(), first=Int(), after=String())
+    game_leaderboard = Field(Leaderboard, game_id=ID(required=True), first=Int(), after=String())
 
     def resolve_current_location(self, info, lobby_id, player_id, **kwargs) -> Union[CurrentGame, None]:
         """
@@ -81,17 +263,27 @@ class CustomQuery:
         :return:
         """
         try:
-            lobby = LobbyModel.objects.get(id=lobby_id)
+            lobby = LobbyModel.objects.select_related("lobby_game__game").get(id=lobby_id)
+            lobby_player = LobbyPlayerModel.objects.select_related("active_guess__location").get(pk=player_id)
         except ObjectDoesNotExist:
             return None
-        locations = lobby.lobby_game.game.locations.all()
-        guessed = LocationModel.objects \
-            .filter(Q(game_id=lobby.lobby_game.game_id) & Q(guesses__player_id=player_id)) \
-            .all()
-        loc = None if len(locations) < len(guessed) else locations[0 if len(guessed) == 0 else len(guessed) - 1]
-        logger.debug("%s %s %s" % (loc, guessed, locations))
-        logger.debug("Player %s; Lobby %s; LobbyGame %s" % (player_id, lobby_id, lobby.lobby_game_id))
-        return CurrentGame(location=loc, lobby_game=lobby.lobby_game, round_number=len(guessed))
+        game = lobby.lobby_game.game
+        if lobby_player.round_lobby_game_id == lobby.lobby_game_id and lobby_player.round_index:
+            round_number = lobby_player.round_index
+            # The round follows round_index, the active guess is gone when it was deleted
+            if lobby_player.active_guess is not None:
+                loc = lobby_player.active_guess.location
+            else:
+                # No location if the locations of the game were removed since the round started
+                loc = LocationModel.objects.filter(id=game.location_ids[round_number - 1]).first() \
+                    if round_number <= len(game.location_ids) else None
+        else:
+            # No guess in this game yet
+            loc = LocationModel.objects.filter(id=game.location_ids[0]).first() if game.location_ids else None
+            round_number = 0
+        logger.debug("Player %s; Lobby %s; LobbyGame %s; Round %s" % (player_id, lobby_id, lobby.lobby_game_id,
+                                                                       round_number))
+        return CurrentGame(location=loc, lobby_game=lobby.lobby_game, round_number=round_number)
 
     def resolve_current_guess(self, info, player_id, location_id, **kwargs) -> Union[Guess, None]:
         """
@@ -108,55 +300,68 @@ class CustomQuery:
         except ObjectDoesNotExist:
             return None
 
-    def resolve_random_location(self, info, count=5, min_density=5, max_density=10000, **kwargs) \
-            -> typing.List[RandomLocation]:
+    def resolve_random_location(self, info, count=5, min_density=5, max_density=10000,
+                                weighting=LocationWeighting.UNIFORM.value, bounding_box=None, min_separation_km=None,
+                                game_id=None, difficulty=None, **kwargs) -> typing.List[RandomLocation]:
         """
-        Returns random locations based on a user request
+        Returns random locations based on a user request, popular presets are served from the location pool
         :param info:
-        :param count: number of locations
+        :param count: number of locations, at most RANDOM_LOCATIONS["MAX_COUNT"]
         :param min_density: minimum population density
         :param max_density: maximum population density
+        :param weighting: weighting of the locations within the density range, ignored with a bounding box
+        :param bounding_box: region of the locations
+        :param min_separation_km: minimum distance between the locations
+        :param game_id: game whose locations the new ones are separated from, requires min_separation_km
+        :param difficulty: percentile of inhabited pixels from the most (0) to the least (100) populated,
+        replaces the density range and the weighting
+        :param kwargs:
+        :return:
+        """
+        # Same maximum as the cost analysis sizes the list with
+        count = min(count, settings.RANDOM_LOCATIONS["MAX_COUNT"])
+        if min_separation_km:
+            existing = LocationModel.objects.filter(game_id=game_id).values_list("latitude", "longitude") \
+                if game_id is not None else ()
+            return generate_separated_locations(count, min_separation_km, existing, min_density=min_density,
+                                                max_density=max_density, weighting=weighting,
+                                                bounding_box=bounding_box, difficulty=difficulty)
+        if bounding_box is None:
+            pooled = location_pool.take(count, min_density, max_density, weighting, difficulty)
+            if pooled is not None:
+                return pooled
+        return generate_random_locations(count, min_density, max_density, weighting, bounding_box, difficulty)
+
+    def resolve_population_densities(self, info, coordinates, **kwargs) -> typing.List[float]:
+        """
+        Returns population densities of many coordinates in one request
+        :param info:
+        :param coordinates: list of coordinates
+        :param kwargs:
+        :return:
+        """
+        densities = get_population_densities([c.latitude for c in coordinates], [c.longitude for c in coordinates])
+        return densities.tolist()
+
+    @login_required
+    def resolve_location_pool_stats(self, info, **kwargs) -> typing.List[LocationPoolStats]:
+        """
+        Returns the state of the location pool
+        :param info:
         :param kwargs:
         :return:
         """
-        if min_density > 10000:
-            min_density = 10000
-        if max_density >= 99999:
-            max_density = 99998
-        if max_density - min_density > 50:
-            max_density = min_density + 50
-        results = []
-        logger.debug("Getting random locations")
-        if min_density >= 4000 or count >= 100:
-            # Performance optimization with random choice of variables
-            filtered = np.argwhere((geo_data_array >= min_density) & (geo_data_array <= max_density))
-            while filtered.shape[0] == 0:
-                # Who would do this
-                if min_density > 50:
-                    min_density -= 50
-                else:
-                    max_density += 50
-                filtered = np.argwhere((geo_data_array >= min_density) & (geo_data_array <= max_density))
-            # Replace if not enough results, exact duplicates should be ruled out by randomness of the resulting latlng
-            chosen = filtered[np.random.choice(filtered.shape[0], count,
-                                               replace=False if filtered.shape[0] > count else True)]
-            return [RandomLocation(**get_latlng_from_xy(res[2], res[1]),
-                                   population_density=geo_data_array[0, res[1], res[2]])
-                    for res in chosen]
-        while count > 0:
-            # "Raycasting"
-            density = 0
-            lat = 0
-            long = 0
-            while density < min_density or density > max_density:
-                # ignore antarctic and far north + sea
-                lat = uniform(-60, 80)
-                long = uniform(-180, 180)
-                density = get_population_density(lat, long)
-            logger.debug("Generated a random location")
-            results.append(RandomLocation(latitude=lat, longitude=long, population_density=density))
-            count -= 1
-        return results
+        return [LocationPoolStats(**stats) for stats in location_pool.stats()]
+
+    @login_required
+    def resolve_document_cache_stats(self, info, **kwargs) -> DocumentCacheStats:
+        """
+        Returns the hit rate of the cache of parsed and validated documents
+        :param info:
+        :param kwargs:
+        :return:
+        """
+        return DocumentCacheStats(**document_backend.stats())
 
     def resolve_results(self, info, lobby_game_id, location_id, **kwargs) -> Results:
         """
@@ -167,16 +372,19 @@ class CustomQuery:
         :param kwargs:
         :return:
         """
-        # TODO: Some caching or other performance boost might benefit a lot
         queryset = GuessModel.objects \
             .filter(lobby_game_id=lobby_game_id, location_id=location_id, guess_end__isnull=False) \
+            .select_related("location", "player") \
             .all()
         location = LocationModel.objects.get(id=location_id)
-        queryset = [Result(guess=g, **get_score_distance(g), lobby_player=g.player,
-                           total_score=sum([get_score_distance(guess)["score"]
-                                            for guess in GuessModel.objects
-                                           .filter(Q(player_id=g.player_id) & Q(lobby_game_id=lobby_game_id))
-                                           .all()]))
+        # Totals of all players in one grouped query
+        totals = dict(GuessModel.objects
+                      .filter(lobby_game_id=lobby_game_id)
+                      .values("player_id")
+                      .annotate(total_score=Coalesce(Sum("score"), 0.))
+                      .values_list("player_id", "total_score"))
+        queryset = [Result(guess=g, score=g.score, distance=g.distance_m, lobby_player=g.player,
+                           total_score=totals.get(g.player_id, 0))
                     for g in queryset]
         return Results(results=queryset, location=location)
 
@@ -188,40 +396,86 @@ class CustomQuery:
         :param kwargs:
         :return:
         """
-        # TODO: Some caching or other performance boost might benefit a lot
-        game: LobbyGameModel = LobbyModel.objects.get(id=lobby_id).lobby_game
-        players: [LobbyPlayerModel] = LobbyPlayerModel.objects \
-            .filter(guesses__lobby_game_id=game.id) \
-            .distinct() \
-            .all()
-        locations = game.game.locations.all()
-        res = sorted([
-            FinalResults(lobby_player=player,
-                         total_score=sum([r["score"]
-                                          for r in [get_score_distance(g)
-                                                    for g in player.guesses.filter(lobby_game_id=game.id).all()]]),
-                         results=[FinalResult(guess=guess, **get_score_distance(guess))
-                                  for guess in player.guesses.filter(lobby_game_id=game.id).all()],
-                         locations=locations)
-            for player in players
-        ], key=lambda r: r.total_score, reverse=True)
+        game: LobbyGameModel = LobbyModel.objects.select_related("lobby_game__game").get(id=lobby_id).lobby_game
+        players_guesses, location_ids = get_final_results(game.id, lambda: _load_final_results(game))
+        # Players and locations are not cached, their current state is loaded with two queries
+        lobby_players = LobbyPlayerModel.objects.in_bulk([guesses[0]["player_id"] for guesses in players_guesses])
+        locations = LocationModel.objects.in_bulk(location_ids)
+        res = []
+        for player_guesses in players_guesses:
+            guesses = [GuessModel(**values) for values in player_guesses]
+            for guess in guesses:
+                guess.player = lobby_players.get(guess.player_id)
+                guess.location = locations.get(guess.location_id)
+            res.append(FinalResults(lobby_player=guesses[0].player,
+                                    total_score=sum(guess.score or 0 for guess in guesses),
+                                    results=[FinalResult(guess=guess, score=guess.score, distance=guess.distance_m)
+                                             for guess in guesses],
+                                    locations=[locations[i] for i in location_ids if i in locations]))
         return res
 
+    @login_required
+    def resolve_leaderboard(self, info, order=LeaderboardOrder.TOTAL_SCORE.value, first=30, after=None,
+                            **kwargs) -> Leaderboard:
+        """
+        Loads a page of the global leaderboard
+        :param info:
+        :param order: score the players are sorted by
+        :param first: page size
+        :param after: cursor of the previous page
+        :param kwargs:
+        :return:
+        """
+        entries, next_cursor = _leaderboard_page(PlayerScoreModel.objects.all(), order, first, after)
+        return Leaderboard(entries=[LeaderboardEntry(player=e.player, total_score=e.total_score,
+                                                     best_score=e.best_game_score, games=e.games)
+                                    for e in entries],
+                           next_cursor=next_cursor)
+
+    @login_required
+    def resolve_game_leaderboard(self, info, game_id, first=30, after=None, **kwargs) -> Leaderboard:
+        """
+        Loads a page of the leaderboard of a game, sorted by the best score
+        :param info:
+        :param game_id:
+        :param first: page size
+        :param after: cursor of the previous page
+        :param kwargs:
+        :return:
+        """
+        entries, next_cursor = _leaderboard_page(GameScoreModel.objects.filter(game_id=game_id), "best_score", first,
+                                                 after)
+        return Leaderboard(entries=[LeaderboardEntry(player=e.player, total_score=e.total_score,
+                                                     best_score=e.best_score, games=e.plays)
+                                    for e in entries],
+                           next_cursor=next_cursor)
+
 
 class AuthenticatedDjangoObjectField(DjangoObjectField):
     """
-    Wraps the resolver in the login_required decorator
+    Wraps the resolver in the login_required decorator, the queryset is optimized for the selection
     """
 
     def get_resolver(self, parent_resolver):
-        return login_required(super().get_resolver(parent_resolver))
+        manager = self.type._meta.model._default_manager
+
+        def object_resolver(root, info, id, **kwargs):
+            try:
+                return optimize(manager.get_queryset(), info).get(pk=id)
+            except manager.model.DoesNotExist:
+                return None
+
+        return login_required(object_resolver)
 
 
 class AuthenticatedDjangoFilterPaginateListField(DjangoFilterPaginateListField):
     """
-    Wraps the resolver in the login_required decorator
+    Wraps the resolver in the login_required decorator, the queryset is optimized for the selection
     """
 
+    def get_queryset(self, manager, info, **kwargs):
+        return optimize(manager.get_queryset(), info)
+
     def get_resolver(self, parent_resolver):
         return login_required(super().get_resolver(parent_resolver))
 
@@ -1,7 +1,9 @@
 from graphene import Schema
 from graphene_django_extras import all_directives
 
+from opengeo.schema.backend import document_backend
 from opengeo.schema.mutation import Mutations
+from opengeo.schema.persisted_queries import persisted_queries
 from opengeo.schema.query import Query
 from opengeo.schema.subscription import Subscription
 
@@ -11,3 +13,6 @@ Definition of the graphql schema
 """
 
 schema = Schema(query=Query, mutation=Mutations, directives=all_directives, subscription=Subscription)
+
+# Operations of the allow-list are parsed and validated on startup
+persisted_queries.precompile(schema, document_backend)
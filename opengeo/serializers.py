@@ -38,7 +38,8 @@ class LobbySerializer(ModelSerializer):
 class LobbyPlayerSerializer(ModelSerializer):
     class Meta:
         model = LobbyPlayerModel
-        fields = '__all__'
+        # Round state is maintained by the guess mutations only
+        exclude = ["round_lobby_game", "round_index", "active_guess"]
 
 
 class LobbyGameSerializer(ModelSerializer):
@@ -0,0 +1,75 @@
+import math
+from collections import defaultdict
+from itertools import product
+from typing import Tuple, Iterable
+
+"""
+Spatial helpers for generated locations
+"""
+
+# Mean earth radius
+EARTH_RADIUS_KM = 6371.0088
+
+
+class SpatialHash:
+    """
+    Grid over points on the unit sphere for checking a minimum separation of locations in O(1) per point.
+    Cells are as large as the chord of the separation, so conflicting points are always in neighbouring cells.
+    """
+    _neighbours = tuple(product((-1, 0, 1), repeat=3))
+
+    def __init__(self, min_separation_km: float):
+        """
+        :param min_separation_km: minimum great-circle distance between two points, must be positive
+        """
+        self.chord = 2 * math.sin(min(min_separation_km / EARTH_RADIUS_KM, math.pi) / 2)
+        self.cells = defaultdict(list)
+
+    @staticmethod
+    def _vector(lat: float, lon: float) -> Tuple[float, float, float]:
+        lat, lon = math.radians(lat), math.radians(lon)
+        return math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat)
+
+    def _cell(self, vector: Tuple[float, float, float]) -> Tuple[int, int, int]:
+        return tuple(math.floor(c / self.chord) for c in vector)
+
+    def _is_free(self, vector: Tuple[float, float, float]) -> bool:
+        x, y, z = self._cell(vector)
+        limit = self.chord ** 2
+        for dx, dy, dz in self._neighbours:
+            for other in self.cells.get((x + dx, y + dy, z + dz), ()):
+                if sum((a - b) ** 2 for a, b in zip(vector, other)) < limit:
+                    return False
+        return True
+
+    def add(self, lat: float, lon: float) -> None:
+        """
+        Adds a point regardless of the separation
+        :param lat: Latitude
+        :param lon: Longitude
+        :return: None
+        """
+        vector = self._vector(lat, lon)
+        self.cells[self._cell(vector)].append(vector)
+
+    def add_all(self, points: Iterable[Tuple[float, float]]) -> None:
+        """
+        Adds points regardless of the separation
+        :param points: (latitude, longitude) pairs
+        :return: None
+        """
+        for lat, lon in points:
+            self.add(lat, lon)
+
+    def add_if_free(self, lat: float, lon: float) -> bool:
+        """
+        Adds a point if it is far enough from all added points
+        :param lat: Latitude
+        :param lon: Longitude
+        :return: whether the point was added
+        """
+        vector = self._vector(lat, lon)
+        if not self._is_free(vector):
+            return False
+        self.cells[self._cell(vector)].append(vector)
+        return True
@@ -0,0 +1,104 @@
+import json
+from unittest import mock
+
+import numpy as np
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase
+
+from opengeo.density import DensityIndex, NODATA
+from opengeo.middleware import GraphQlAuthenticationStatusCodeMiddleware
+from opengeo.models import GameModel, LobbyGameModel, LobbyModel, LobbyPlayerModel, PlayerModel
+from opengeo.schema.schema import schema
+
+
+class AuthenticationStatusCodeMiddlewareTest(SimpleTestCase):
+    def process(self, body) -> HttpResponse:
+        middleware = GraphQlAuthenticationStatusCodeMiddleware(
+            lambda request: HttpResponse(json.dumps(body), content_type="application/json"))
+        return middleware(RequestFactory().post("/graphql"))
+
+    def test_single_operation(self):
+        response = self.process({"errors": [{"message": "You do not have permission to perform this action"}]})
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.content, b"{}")
+
+    def test_mixed_batch(self):
+        authorized = {"data": {"lobby": {"id": "1"}}, "id": 1, "status": 200}
+        unauthorized = {"errors": [{"message": "You do not have permission to perform this action"}],
+                        "data": {"player": None}, "id": 2, "status": 200}
+        response = self.process([authorized, unauthorized])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), [authorized, {**unauthorized, "status": 401}])
+
+
+class DensityIndexTest(SimpleTestCase):
+    def test_plateau_percentiles_are_spread(self):
+        # Three quarters of the land share the lowest density, like the sparsely populated land of the dataset
+        data = np.ones((400, 100), dtype=np.uint16)
+        data[:, 75:] = np.arange(2, 27, dtype=np.uint16)
+        data[:, :10] = NODATA
+        index = DensityIndex.build(data)
+        inhabited = index.count(0, NODATA - 1)
+        for percentile in (10, 50, 70):
+            ys, xs, densities = index.sample_percentile(percentile, 1, 500, inhabited)
+            self.assertTrue(np.all(densities == 1))
+            # Samples of the plateau come from all of its rows, not from a band of them
+            self.assertGreater(np.ptp(ys), 300)
+            self.assertGreater(len(np.unique(ys // 100)), 3)
+
+    def test_restrict(self):
+        data = np.arange(400 * 100, dtype=np.uint16).reshape(400, 100) % 7
+        index = DensityIndex.build(data).restrict(1, 5, (100, 300))
+        ys, xs = np.divmod(index.offsets, 100)
+        self.assertEqual(len(index.offsets), np.count_nonzero((data[100:300] >= 1) & (data[100:300] <= 5)))
+        self.assertTrue(np.all((ys >= 100) & (ys < 300)))
+        self.assertTrue(np.all(np.diff(index.densities.astype(int)) >= 0))
+        self.assertTrue(np.array_equal(data[ys, xs], index.densities))
+
+
+class LobbyListQueryCountTest(TestCase):
+    query = """
+        query Lobbies($limit: Int) {
+            lobbyList(limit: $limit) {
+                id
+                owner { name }
+                lobbyGame { game { name rounds creator { name } } }
+                lobbyPlayers { id state player { name } }
+            }
+        }
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = PlayerModel.objects.create(name="user")
+        for i in range(20):
+            owner = PlayerModel.objects.create(name=f"owner{i}")
+            game = GameModel.objects.create(name=f"game{i}", time_limit=60, creator=owner)
+            lobby = LobbyModel.objects.create(owner=owner, lobby_game=LobbyGameModel.objects.create(game=game))
+            for j in range(3):
+                LobbyPlayerModel.objects.create(player=PlayerModel.objects.create(name=f"player{i}-{j}"), lobby=lobby)
+
+    def execute(self, limit: int):
+        request = RequestFactory().post("/graphql")
+        request.user = self.user
+        return schema.execute(self.query, context_value=request, variables={"limit": limit})
+
+    def test_constant_query_count(self):
+        for limit in (5, 20):
+            # Lobbies with their owners and games, then the lobby players with their players
+            with self.assertNumQueries(2):
+                result = self.execute(limit)
+            self.assertIsNone(result.errors)
+            self.assertEqual(len(result.data["lobbyList"]), limit)
+
+    def test_constant_query_count_without_optimizer(self):
+        # Lobbies only, so every relation goes through the DataLoaders of the request
+        with mock.patch("opengeo.schema.query.optimize", lambda queryset, info: queryset):
+            for limit in (5, 20):
+                # Lobbies, owners, lobby games, lobby players, games, then creators and players in one batch
+                with self.assertNumQueries(6):
+                    result = self.execute(limit)
+                self.assertIsNone(result.errors)
+                self.assertEqual(len(result.data["lobbyList"]), limit)
+                self.assertTrue(all(len(lobby["lobbyPlayers"]) == 3 and lobby["lobbyGame"]["game"]["creator"]
+                                    for lobby in result.data["lobbyList"]))
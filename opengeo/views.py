@@ -1,14 +1,25 @@
 # Create your views here.
+import json
 from hashlib import md5
+from hmac import compare_digest
 from re import compile, escape
+from typing import Optional
 
 import requests
 from PIL import Image
-from django.http import HttpResponse, HttpResponseRedirect
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseRedirect, HttpResponseBadRequest
 from fake_useragent import UserAgent
+from graphene_django.views import GraphQLView, HttpError
+from graphql import GraphQLError
+from graphql.execution import ExecutionResult
 from rest_framework import status
 from rest_framework.views import APIView
 
+from opengeo.schema.backend import document_backend
+from opengeo.schema.metrics import registry
+from opengeo.schema.persisted_queries import persisted_queries
+
 # UserAgent and session for google streetview requests
 ua = UserAgent()
 s = requests.Session()
@@ -112,6 +123,77 @@ class IdenticonView(APIView):
         image.save(response, "PNG")
         return response
 
+
+class MetricsView(APIView):
+    """
+    Serves the graphql metrics of this process in the Prometheus text format to scrapers sending the configured token
+    as "Authorization: Bearer <token>", without a configured token the endpoint does not exist
+    """
+    authentication_classes = []
+
+    def get(self, request, *args, **kwargs):
+        token = settings.GRAPHQL_METRICS["TOKEN"]
+        if not token:
+            raise Http404
+        if not compare_digest(request.headers.get("Authorization", "").encode(), f"Bearer {token}".encode()):
+            return HttpResponse(status=status.HTTP_401_UNAUTHORIZED)
+        return HttpResponse(registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+class CachedGraphQLView(GraphQLView):
+    """
+    GraphQL view sharing the cache of parsed and validated documents with the websocket consumer,
+    supports automatic persisted queries, batches of operations and reports the extensions of the execution result
+
+    A JSON array of operations is executed in one request, the operations share the request as their context with
+    its authenticated user and DataLoaders, the response is the array of their results.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault("backend", document_backend)
+        super().__init__(**kwargs)
+
+    def parse_body(self, request):
+        # Views are instantiated per request, so the batch mode only applies to this request
+        self.batch = self.get_content_type(request) == "application/json" and request.body.lstrip()[:1] == b"["
+        data = super().parse_body(request)
+        max_size = settings.GRAPHQL_BATCH["MAX_SIZE"]
+        if self.batch and len(data) > max_size:
+            raise HttpError(HttpResponseBadRequest(f"Batches are limited to {max_size} operations."))
+        return data
+
+    @staticmethod
+    def get_extensions(request, data) -> Optional[dict]:
+        extensions = request.GET.get("extensions") or data.get("extensions")
+        if extensions and isinstance(extensions, str):
+            try:
+                extensions = json.loads(extensions)
+            except ValueError:
+                raise HttpError(HttpResponseBadRequest("Extensions are invalid JSON."))
+        return extensions
+
+    def execute_graphql_request(self, request, data, query, variables, operation_name, show_graphiql=False):
+        try:
+            query = persisted_queries.resolve(query, self.get_extensions(request, data))
+        except GraphQLError as e:
+            return ExecutionResult(errors=[e])
+        result = super().execute_graphql_request(request, data, query, variables, operation_name, show_graphiql)
+        # graphene-django drops the extensions, json_encode adds them to the response
+        request.graphql_extensions = getattr(result, "extensions", None)
+        if self.batch and result is not None and not result.invalid and \
+                document_backend.document_from_string(self.schema, query).get_operation_type(operation_name) == \
+                "mutation":
+            # Later operations of the batch must not see objects loaded before the mutation
+            request.loaders = None
+        return result
+
+    def json_encode(self, request, d, pretty=False):
+        extensions = getattr(request, "graphql_extensions", None)
+        if extensions:
+            d["extensions"] = extensions
+        request.graphql_extensions = None
+        return super().json_encode(request, d, pretty)
+
 # -- Some locations for population density testing --
 
 # cz